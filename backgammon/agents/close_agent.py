@@ -26,8 +26,9 @@ class CloseAgent:
         score = 0
 
         # Check the number of building blocks
-        for col in temp_game.grid:
-            if len(col) > 1 and col[0] == self.player:
-                score += len(col)
+        for i in range(temp_game.NUMCOLS):
+            count = temp_game.count(i, self.player)
+            if count > 1:
+                score += count
 
         return score
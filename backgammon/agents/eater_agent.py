@@ -7,12 +7,14 @@ import random
 
 
 class EaterAgent:
-    def __init__(self, player_token):
+    def __init__(self, player_token, rng=None):
         """
-        Initialize the EaterAgent with a token ('x' or 'o').
+        Initialize the EaterAgent with a token ('x' or 'o'), and the
+        random.Random for its random moves (default: the global random).
         """
         self.player = player_token
         self.name = 'Eater'
+        self.rng = rng if rng is not None else random
 
     def get_action(self, moves, game):
         """
@@ -30,8 +32,8 @@ class EaterAgent:
         for move in moves:
             for start, end in move:
                 # Check if the end point has exactly one opponent piece
-                if end != 'off' and len(game.grid[end]) == 1 and game.grid[end][0] == opponent_token:
+                if end != 'off' and game.count(end, opponent_token) == 1:
                     return move  # This is an eating move
 
         # If no eating move is found, return a random move
-        return random.choice(list(moves))
+        return self.rng.choice(list(moves))
@@ -1,60 +1,219 @@
+import heapq
 import math
-PRUNING_FACTOR = 10
+import multiprocessing
+import time
+
+from .. import profiling
+from ..bearoff import best_bearoff_action
+from ..game import Game
+from ..transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Moves per roll that get the full search without a time limit, the best by
+# static_score (see best_moves); keeps a depth 2 move about as fast as when wide
+# rolls were searched at depth 0
+PRUNING_FACTOR = 3
+# Distinct rolls of a chance node: one more ply multiplies the search by this many times the width
+ROLLS = 21
+# Weights of the static move score (see static_score)
+STATIC_WEIGHTS = {'hits': 1., 'blocks': 0.2, 'pips': 0.05}
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the time limit of the move runs out. """
+
+
 class ExpectMinMaxAgent:
-    def __init__(self, depth=1, player='x', heuristic=None):
+    def __init__(self, depth=1, player='x', heuristic=None, table_bits=16, pruning=True, time_limit=None,
+                 workers=None, bearoff=True, width=PRUNING_FACTOR):
         self.heuristic = heuristic
         self.depth = depth  # Depth of search tree
         self.factor = 1/36  # Factor to normalize the expected value of dice rolls
         self.player = player
         self.opponent = 'o' if player == 'x' else 'x'
         self.name = 'ExpectiMinMax'
+        # Chance node and leaf values, kept across the turns of one game. None disables it.
+        self.table_bits = table_bits
+        self.table = TranspositionTable(table_bits) if table_bits else None
+        self.table_game = None
+        # Star2 pruning needs the evaluation to be bounded; won and lost positions
+        # are clamped to the bounds (see evaluate)
+        self.bounds = heuristic.value_range() if hasattr(heuristic, 'value_range') else None
+        self.pruning = pruning and self.bounds is not None
+        # Seconds per move. If set, depth is the deepest the search may go (see get_action)
+        self.time_limit = time_limit
+        self.deadline = None
+        self.completed_depth = 0
+        # If set, root moves are searched in parallel by a pool of this many processes
+        self.workers = workers
+        self.pool = None
+        # Play bear-off races from the bear-off database
+        self.bearoff = bearoff
+        # Moves searched in full per roll (and at the root) without a time limit. With a
+        # time limit, search_width is set to what fits in the time left (see get_action)
+        self.width = width
+        self.search_width = width
 
-    def expectiminimax(self, game, depth, maximizingPlayer, chance_node, player, moves):
+    def expectiminimax(self, game, depth, maximizingPlayer, chance_node, player, moves,
+                       alpha=-math.inf, beta=math.inf):
         """
         Core expectiminimax function:
         - game: the current game state
         - depth: depth of the search tree
         - maximizingPlayer: True if we are maximizing, False if minimizing
+        - alpha, beta: the search window. A value outside of it is only a bound
+          of the real one (at most alpha or at least beta).
         """
+        if profiling.active is not None:
+            profiling.active.count('nodes')
         if depth <= 0 or game.is_over():
-            if chance_node:
-                return self.evaluate(game, self.player)
-            return self.evaluate(game, player)
+            # leaves are keyed without a side to move, apart from the chance nodes
+            return self.cached_value(game, 0, None, self.evaluate, game, self.player)
+
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchTimeout
 
         # Handle chance nodes (dice roll or random events)
         if chance_node:
-            return self.handle_chance_node(game, depth, player, maximizingPlayer)
+            return self.cached_value(game, depth, player, self.handle_chance_node, game, depth, player,
+                                     maximizingPlayer, alpha, beta, alpha=alpha, beta=beta)
+
+        if not moves:
+            # no legal move for this roll: the turn passes on
+            return self.expectiminimax(game, depth - 1, not maximizingPlayer, True,
+                                       self.opponent if maximizingPlayer else self.player, None, alpha, beta)
 
         if maximizingPlayer:
             maxEval = -math.inf
             for move in moves:  # Assuming 'x' is the agent's token
                 ate_list = game.take_action(move, player)
-                eval = self.expectiminimax(game, depth - 1, not maximizingPlayer, True, self.opponent, None)
+                eval = self.expectiminimax(game, depth - 1, not maximizingPlayer, True, self.opponent, None,
+                                           max(alpha, maxEval), beta)
                 maxEval = max(maxEval, eval)
                 game.undo_action(move, player, ate_list)
+                if maxEval >= beta:
+                    break
             return maxEval
 
         else:
             minEval = math.inf
             for move in moves:
                 ate_lst = game.take_action(move, player)
-                eval = self.expectiminimax(game, depth - 1, not maximizingPlayer, True, self.player, None)
+                eval = self.expectiminimax(game, depth - 1, not maximizingPlayer, True, self.player, None,
+                                           alpha, min(beta, minEval))
                 minEval = min(minEval, eval)
                 game.undo_action(move, player, ate_lst)
+                if minEval <= alpha:
+                    break
             return minEval
 
-    def handle_chance_node(self, game, depth, player, maximizingPlayer):
+    def cached_value(self, game, depth, player, search, *args, alpha=-math.inf, beta=math.inf):
+        """
+        Value of the position for player (the player whose turn it is), from the
+        transposition table if it was searched at least depth deep, otherwise
+        search(*args), which is stored. Leaves pass player None: they are
+        evaluated the same whoever is to move, and without a side key they
+        can't be answered by a chance node entry of the same position.
+        Bounds (values outside of the window alpha, beta) are stored as such and
+        only reused when they are outside of the window of the lookup too.
+        """
+        if self.table is None:
+            return search(*args)
+        key = game.zobrist_hash(player)
+        entry = self.table.lookup(key, depth)
+        if entry is not None:
+            value, node_type = entry[1], entry[3]
+            if node_type == EXACT or (node_type == LOWER and value >= beta) \
+                    or (node_type == UPPER and value <= alpha):
+                if profiling.active is not None:
+                    profiling.active.count('table_hits')
+                return value
+        value = search(*args)
+        if not self.pruning:
+            node_type = EXACT
+        elif value <= alpha:
+            node_type = UPPER
+        elif value >= beta:
+            node_type = LOWER
+        else:
+            node_type = EXACT
+        self.table.store(key, value, depth, node_type)
+        return value
+
+    def handle_chance_node(self, game, depth, player, maximizingPlayer, alpha=-math.inf, beta=math.inf):
         """
         Handle chance nodes (random events like dice rolls).
         We return the expected value of all possible outcomes.
+
+        Within a window, the rolls are searched Star2 style (Ballard, 1983): a probe
+        of one move per roll bounds the value of each roll from one side, then each
+        roll is searched with a window narrowed by the bounds of the others. Once
+        the expected value is known to be outside of (alpha, beta), that bound is
+        returned without searching the remaining rolls.
         """
-        expected_value = 0
+        outcomes = []
         for dice, factor in [(t, 2)for t in game.get_possible_rolls_excluding_doubles()] + [(t, 1) for t in game.get_possible_doubles()]:
             moves = game.get_actions(dice, player)
-            if len(moves) > PRUNING_FACTOR:
-                depth = 0
-            dice_value = self.expectiminimax(game, depth, maximizingPlayer, False, player, moves) * factor
-            expected_value += dice_value * self.factor
+            if len(moves) > self.search_width:
+                # only search the most promising moves
+                moves = self.best_moves(game, moves, player, self.search_width)
+            outcomes.append((moves, depth, factor))
+
+        if not self.pruning or (alpha == -math.inf and beta == math.inf):
+            expected_value = 0
+            for moves, depth, factor in outcomes:
+                dice_value = self.expectiminimax(game, depth, maximizingPlayer, False, player, moves) * factor
+                expected_value += dice_value * self.factor
+            return expected_value
+
+        # Star2 probing: the first move of a roll gives a lower bound of its value
+        # if we are maximizing and an upper one if minimizing
+        low, high = self.bounds
+        lows, highs = [], []
+        for moves, depth, factor in outcomes:
+            if depth <= 0 or not moves:
+                value = self.expectiminimax(game, depth, maximizingPlayer, False, player, moves)
+                lows.append(value)
+                highs.append(value)
+                continue
+            move = next(iter(moves))
+            ate_list = game.take_action(move, player)
+            value = self.expectiminimax(game, depth - 1, not maximizingPlayer, True,
+                                        self.opponent if maximizingPlayer else self.player, None, low, high)
+            game.undo_action(move, player, ate_list)
+            lows.append(value if maximizingPlayer else low)
+            highs.append(high if maximizingPlayer else value)
+
+        # weighted sums of the bounds of the rolls after each one
+        rest_lows, rest_highs = [0] * len(outcomes), [0] * len(outcomes)
+        for i in range(len(outcomes) - 1, 0, -1):
+            factor = outcomes[i][2]
+            rest_lows[i - 1] = rest_lows[i] + lows[i] * factor * self.factor
+            rest_highs[i - 1] = rest_highs[i] + highs[i] * factor * self.factor
+        first_low = rest_lows[0] + lows[0] * outcomes[0][2] * self.factor
+        first_high = rest_highs[0] + highs[0] * outcomes[0][2] * self.factor
+        if first_low >= beta:
+            return first_low
+        if first_high <= alpha:
+            return first_high
+
+        # Star1: search the rolls in turn, each within the window that can still
+        # move the expected value into (alpha, beta)
+        expected_value = 0
+        for i, (moves, depth, factor) in enumerate(outcomes):
+            probability = factor * self.factor
+            roll_alpha = (alpha - expected_value - rest_highs[i]) / probability
+            roll_beta = (beta - expected_value - rest_lows[i]) / probability
+            if lows[i] == highs[i]:
+                value = lows[i]
+            else:
+                value = self.expectiminimax(game, depth, maximizingPlayer, False, player, moves,
+                                            max(roll_alpha, lows[i]), min(roll_beta, highs[i]))
+                value = min(max(value, lows[i]), highs[i])
+            expected_value += value * factor * self.factor
+            if value <= roll_alpha:
+                return expected_value + rest_highs[i]
+            if value >= roll_beta:
+                return expected_value + rest_lows[i]
         return expected_value
 
     def evaluate(self, game, player=None):
@@ -62,10 +221,12 @@ class ExpectMinMaxAgent:
         Evaluate the game state.
         You will need to implement a custom evaluation function based on game rules.
         """
-        if player != self.player:
-            return self.heuristic.evaluate(game)
-        else:
-            return self.heuristic.evaluate(game)
+        # always from the agent's side, so agents can share one evaluator
+        value = self.heuristic.evaluate(game, self.player)
+        if self.bounds is not None:
+            # won and lost positions score +-inf, keep them within the bounds
+            value = min(max(value, self.bounds[0]), self.bounds[1])
+        return value
 
     def get_action(self, moves, game=None):
         """
@@ -75,28 +236,201 @@ class ExpectMinMaxAgent:
         - game: the current game state
         Returns:
         - The best move based on the expectiminimax algorithm
+        With a time_limit, the search deepens one ply at a time up to depth and
+        the move of the deepest iteration finished within the time limit is
+        returned (the first iteration always finishes).
         """
+        if self.bearoff:
+            move = best_bearoff_action(game, moves, self.player)
+            if move is not None:
+                return move
+
+        if self.table is not None:
+            # entries stay valid across turns, but not into a new game
+            if game is not self.table_game:
+                self.table.clear()
+                self.table_game = game
+            self.table.new_search()
+
+        if self.time_limit is None:
+            if self.depth >= 2 and len(moves) > self.width:
+                moves = self.best_moves(game, moves, self.player, self.width)
+            return self.search_root(moves, game, self.depth)[0]
+
+        # With a time limit, every move can get the full search; each iteration
+        # searches them best first (by the values of the one before) until time runs out
+        moves = list(moves)
+        start = time.monotonic()
+        deadline = start + self.time_limit
+        # a search cut short leaves its moves on the board, so it runs on a copy
+        search_game = game.clone()
+        best_move = None
+        values = {}
+        try:
+            for depth in range(1, self.depth + 1):
+                values = {}
+                best_move, values = self.search_root(moves, search_game, depth, values)
+                self.completed_depth = depth
+                # search the best moves first next time, so the window is narrow early
+                moves = sorted(moves, key=lambda move: values[move], reverse=True)
+                # the next iteration searches about ROLLS * search_width times as many
+                # positions as this one: search as many moves per roll as fit in the time left
+                now = time.monotonic()
+                self.search_width = max(1, int((deadline - now) / (ROLLS * max(now - start, 1e-6))))
+                start = now
+                self.deadline = deadline
+        except SearchTimeout:
+            # moves searched in the unfinished iteration still count if the best
+            # move of the last one, searched first, is among them
+            if moves[0] in values:
+                best_move = max(values, key=values.get)
+        finally:
+            self.deadline = None
+            self.search_width = self.width
+        return best_move
+
+    def search_root(self, moves, game, depth, values=None):
+        """
+        Search each move depth plies deep. Returns the best move and the value
+        of each move (an upper bound for the moves that can't beat the best one),
+        filled into values as the moves are done if it is given.
+        """
+        values = {} if values is None else values
+        if self.workers:
+            return self.search_root_parallel(moves, game, depth, values)
+
         best_move = None
         best_value = -math.inf
-        depth = self.depth
 
         # Loop over all available moves
         for move in moves:
-            # Simulate the move
-            ateList = game.take_action(move, self.player)
-            if len(moves) > PRUNING_FACTOR:
-                depth = 0
-            else:
-                depth = self.depth
-            # Run expectiminimax to evaluate this move
-            value = self.expectiminimax(game, depth - 1, False, True,
-                                        self.opponent, None)
-
-            # Undo the simulated move
-            game.undo_action(move, self.player, ateList)
+            # Moves that can't beat the best one so far only need an upper bound
+            value = self.search_move(game, move, depth, best_value if self.pruning else -math.inf)
+            values[move] = value
 
             # Maximizing the score for the agent
             if value > best_value:
                 best_value = value
                 best_move = move
-        return best_move
\ No newline at end of file
+        return best_move, values
+
+    def search_root_parallel(self, moves, game, depth, values):
+        """
+        search_root over the worker pool. Every move is searched on its own copy
+        of the game with a full window, so all values are exact, and ties go to
+        the first move, whatever the order the workers finish in.
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_search_worker,
+                                             initargs=(self.player, self.heuristic, self.table_bits, self.pruning,
+                                                       self.width))
+        moves = list(moves)
+        results = self.pool.map(_search_move, [(game, move, depth, self.deadline, self.search_width)
+                                               for move in moves])
+        values.update((move, value) for move, value in zip(moves, results) if value is not None)
+        if None in results:
+            raise SearchTimeout
+
+        best_move = None
+        best_value = -math.inf
+        for move, value in zip(moves, results):
+            if value > best_value:
+                best_value = value
+                best_move = move
+        return best_move, values
+
+    def search_move(self, game, move, depth, alpha=-math.inf):
+        """
+        Value of playing move, searched depth plies deep (at most alpha if it can't beat alpha).
+        """
+        # Simulate the move
+        ateList = game.take_action(move, self.player)
+        # Run expectiminimax to evaluate this move
+        value = self.expectiminimax(game, depth - 1, False, True, self.opponent, None, alpha)
+        # Undo the simulated move
+        game.undo_action(move, self.player, ateList)
+        return value
+
+    def best_moves(self, game, moves, player, k):
+        """
+        The k best of moves by static_score, the best first.
+        """
+        return heapq.nlargest(k, moves, key=lambda move: self.static_score(game, move, player))
+
+    @staticmethod
+    def static_score(game, move, player):
+        """
+        Quick guess of how good move is, without searching: the opponent's
+        checkers it hits (what EaterAgent looks for), the checkers it adds to
+        blocks (what CloseAgent counts) and the pips it gains, the ones moved
+        plus the ones a hit checker loses. Weighted by STATIC_WEIGHTS.
+        """
+        board = game.board
+        sign = Game.SIGN[player]
+        x = player == 'x'
+        # the player's checkers on each point the move touches, as it goes;
+        # worked out on the side so the board isn't changed and restored
+        counts = {}
+        hits = 0
+        # pips of point i for x count up from point 0, for o from point 23
+        pips = 0
+        for start, end in move:
+            if start == Game.ON:
+                pips += 25
+            else:
+                n = counts.get(start)
+                counts[start] = (board[start] * sign if n is None else n) - 1
+                pips += start + 1 if x else Game.NUMCOLS - start
+            if end != Game.OFF:
+                n = counts.get(end)
+                if n is None:
+                    n = board[end] * sign
+                    if n == -1:
+                        # a blot of the opponent's is hit and loses its pips
+                        hits += 1
+                        pips += 25 - (Game.NUMCOLS - end if x else end + 1)
+                        n = 0
+                counts[end] = n + 1
+                pips -= end + 1 if x else Game.NUMCOLS - end
+        blocks = sum(n for n in counts.values() if n > 1) \
+            - sum(board[i] * sign for i in counts if board[i] * sign > 1)
+        return STATIC_WEIGHTS['hits'] * hits + STATIC_WEIGHTS['blocks'] * blocks \
+            + STATIC_WEIGHTS['pips'] * pips
+
+    def close(self):
+        """
+        Shut down the worker pool of a parallel search, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+# Agent of a search worker process, built once by _init_search_worker
+_worker_agent = None
+
+
+def _init_search_worker(player, heuristic, table_bits, pruning, width):
+    global _worker_agent
+    _worker_agent = ExpectMinMaxAgent(1, player, heuristic, table_bits, pruning, width=width)
+
+
+def _search_move(task):
+    """
+    Value of one root move for ExpectMinMaxAgent.search_root_parallel, or None
+    if the deadline passed first.
+    """
+    game, move, depth, deadline, width = task
+    agent = _worker_agent
+    agent.search_width = width
+    # start every move from an empty table, so its value doesn't depend on
+    # which moves this worker happened to search before
+    if agent.table is not None:
+        agent.table.clear()
+    agent.deadline = deadline
+    try:
+        return agent.search_move(game, move, depth)
+    except SearchTimeout:
+        return None
+    finally:
+        agent.deadline = None
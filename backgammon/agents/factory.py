@@ -0,0 +1,56 @@
+from ..eval_cache import EvaluationCache
+from ..game import Game
+from ..heuristics import HeuristicEvaluator
+from .close_agent import CloseAgent
+from .eater_agent import EaterAgent
+from .expecti_mm_agent import ExpectMinMaxAgent
+from .human_agent import HumanAgent
+from .random_agent import RandomAgent
+from .rollout_agent import TRIALS, RolloutAgent
+from .td_gammon_agent import TDAgent
+
+AGENT_NAMES = ['random', 'eater', 'close', 'expectiminimax', 'td', 'rollout', 'human']
+
+
+def make_agent(spec, player, load_model=None, search_workers=None, cache_size=None, rng=None):
+    """
+    Build an agent for token player from a spec: an agent name, optionally
+    followed by a search depth, e.g. 'expectiminimax:2', and for expectiminimax
+    by a time limit in seconds per move, e.g. 'expectiminimax:4:0.5', which
+    makes depth the deepest it searches. load_model is only
+    called for 'td', so callers can defer importing TensorFlow until the
+    network is needed. search_workers is the number of processes an
+    expectiminimax agent searches with (see ExpectMinMaxAgent.search_root_parallel).
+    With cache_size, td and expectiminimax agents evaluate through an
+    EvaluationCache of that many positions. rng is the random.Random of the
+    agents that play random moves (random, eater), by default the global random.
+    For rollout, the number is the trials per move, e.g. 'rollout:288'; it plays
+    on with the heuristic and spreads its trials over search_workers processes.
+    """
+    name, _, depth = spec.partition(':')
+    depth, _, time_limit = depth.partition(':')
+    trials = int(depth) if depth else None
+    depth = int(depth) if depth else 1
+    time_limit = float(time_limit) if time_limit else None
+    if name == 'random':
+        return RandomAgent(player, rng)
+    if name == 'eater':
+        return EaterAgent(player, rng)
+    if name == 'close':
+        return CloseAgent(player)
+    if name == 'expectiminimax':
+        heuristic = HeuristicEvaluator(Game.new(), Game.TOKENS.index(player))
+        if cache_size:
+            heuristic = EvaluationCache(heuristic, cache_size)
+        return ExpectMinMaxAgent(depth, player, heuristic, time_limit=time_limit, workers=search_workers)
+    if name == 'td':
+        model = load_model()
+        if cache_size:
+            model = EvaluationCache(model, cache_size)
+        return TDAgent(player, model)
+    if name == 'rollout':
+        heuristic = HeuristicEvaluator(Game.new(), Game.TOKENS.index(player))
+        return RolloutAgent(player, heuristic=heuristic, trials=trials or TRIALS, workers=search_workers, rng=rng)
+    if name == 'human':
+        return HumanAgent(player)
+    raise ValueError('Unknown agent %r, expected one of %s' % (spec, ', '.join(AGENT_NAMES)))
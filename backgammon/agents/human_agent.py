@@ -68,10 +68,33 @@ class HumanAgent(object):
             elif move[::-1] in moves:
                 move = move[::-1]
                 return move
+
+            # moves only holds one move per resulting position
+            same_move = self.same_position_move(move, moves, game) if game is not None else None
+            if same_move:
+                return same_move
             else:
                 print("moves", moves)
                 print("You can't play that move")
 
+    def same_position_move(self, move, moves, game):
+        """
+        Return the legal move that leads to the same position as move, if any.
+        """
+        temp_game = game.clone()
+        try:
+            temp_game.take_action(move, self.player)
+        except (IndexError, TypeError):
+            return None
+        target = temp_game.signature()
+        for candidate in moves:
+            ateList = game.take_action(candidate, self.player)
+            position = game.signature()
+            game.undo_action(candidate, self.player, ateList)
+            if position == target:
+                return candidate
+        return None
+
     def get_formatted_move(self, move):
         try:
             start, end = move.split(",")
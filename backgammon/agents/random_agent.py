@@ -2,9 +2,13 @@ import random
 
 class RandomAgent(object):
 
-    def __init__(self, player):
+    def __init__(self, player, rng=None):
+        """
+        rng is the random.Random the moves are picked with, by default the global random.
+        """
         self.player = player
         self.name = 'Random'
+        self.rng = rng if rng is not None else random
 
     def get_action(self, moves, game=None):
-        return random.choice(list(moves)) if moves else None
+        return self.rng.choice(list(moves)) if moves else None
@@ -0,0 +1,188 @@
+import math
+import multiprocessing
+import random
+
+import numpy as np
+
+from ..bearoff import best_bearoff_action
+from ..dice import StratifiedDice
+from ..game import Game
+from .expecti_mm_agent import ExpectMinMaxAgent
+from .td_gammon_agent import TDAgent
+
+# Trials per move at most, and per round between early stopping checks (one of each first roll)
+TRIALS = 72
+ROUND = 36
+
+
+class RolloutAgent(object):
+    """
+    Monte Carlo rollouts: each candidate move is scored by the average
+    result of trials games played on from it by a fast base policy, the
+    greedy TD agent with a model or the 1-ply heuristic agent with a
+    heuristic. A trial scores 1 if the player wins and 0 if it loses. With a
+    horizon, a trial stops after that many half-moves and scores the
+    position with the model, or the heuristic scaled to [0, 1]. Only use it
+    with a model that estimates the chance of winning well: the heuristic
+    doesn't count the race, so short rollouts judged by it keep hitting
+    instead of bearing off.
+
+    Variance reduction:
+    * the first rolls of the trials are quasi-random (StratifiedDice), so
+      every 36 trials see each of the 36 replies once;
+    * trial k of every candidate plays with the same dice (common random
+      numbers), so the moves are compared on the same luck;
+    * after every ROUND trials, a move is dropped once it can't be better
+      than the best one so far by tolerance (a chance of winning), with z
+      standard errors of their paired differences, and the search stops
+      once a single move is left.
+
+    Only the best candidates moves by 1-ply value are rolled out. With
+    workers, the trials run in that many processes (the model must be
+    picklable, e.g. a NumpyModel).
+    """
+
+    def __init__(self, player, model=None, heuristic=None, trials=TRIALS, horizon=None, candidates=6,
+                 z=2., tolerance=0.002, workers=None, rng=None):
+        self.player = player
+        self.model = model
+        self.heuristic = heuristic
+        self.name = 'Rollout'
+        self.trials = trials
+        self.horizon = horizon
+        self.candidates = candidates
+        self.z = z
+        self.tolerance = tolerance
+        self.workers = workers
+        self.pool = None
+        self.rng = rng if rng is not None else random
+        if model is not None:
+            self.policies = [TDAgent(token, model) for token in Game.TOKENS]
+        else:
+            # every trial plays on a new clone, which would clear a transposition table each time
+            self.policies = [ExpectMinMaxAgent(1, token, heuristic, table_bits=None) for token in Game.TOKENS]
+            self.bounds = heuristic.value_range()
+        # trials played by the last get_action
+        self.trials_played = 0
+
+    def get_action(self, moves, game):
+        if not moves:
+            return None
+        action = best_bearoff_action(game, moves, self.player)
+        if action is not None:
+            return action
+        moves = self.rank_moves(moves, game)[:self.candidates]
+        if len(moves) == 1:
+            return moves[0]
+
+        seed = self.rng.getrandbits(32)
+        results = [[] for _ in moves]
+        alive = list(range(len(moves)))
+        self.trials_played = 0
+        while self.trials_played < self.trials and len(alive) > 1:
+            trials = range(self.trials_played, min(self.trials_played + ROUND, self.trials))
+            for i, values in zip(alive, self.run_trials(game, [moves[i] for i in alive], seed, trials)):
+                results[i] += values
+            self.trials_played = trials.stop
+            alive = self.prune(alive, results)
+        return moves[max(alive, key=lambda i: np.mean(results[i]))]
+
+    def rank_moves(self, moves, game):
+        """
+        moves as a list, the best first by the value of the position they lead to.
+        """
+        values = {}
+        for move in moves:
+            ateList = game.take_action(move, self.player)
+            values[move] = self.value(game, Game.TOKENS.index(game.opponent(self.player)))
+            game.undo_action(move, self.player, ateList)
+        return sorted(moves, key=values.get, reverse=True)
+
+    def value(self, game, player_num):
+        """
+        Chance that self.player wins from the position, with
+        Game.TOKENS[player_num] to move: 1 or 0 if the game is over, else the
+        network's estimate or the heuristic scaled to [0, 1].
+        """
+        if game.is_over():
+            return 1. if game.is_won(self.player) else 0.
+        if self.model is not None:
+            features = game.extract_features(Game.TOKENS[player_num]).astype(np.float32)
+            # the network gives the chance that players[1] wins
+            v = float(np.asarray(self.model.predict_batch(features)).reshape(-1)[0])
+            return v if self.player == game.players[1] else 1. - v
+        low, high = self.bounds
+        return (self.heuristic.evaluate(game, self.player) - low) / (high - low)
+
+    def rollout(self, game, move, seed, trial):
+        """
+        Result of trial number trial after playing move.
+        """
+        game = game.clone()
+        game.dice = StratifiedDice(trial, random.Random('%d-%d' % (seed, trial)))
+        game.take_action(move, self.player)
+        player_num = Game.TOKENS.index(game.opponent(self.player))
+        steps = 0
+        while not game.is_over() and (self.horizon is None or steps < self.horizon):
+            policy = self.policies[player_num]
+            moves = game.get_actions(game.roll_dice(), policy.player)
+            if moves:
+                game.take_action(policy.get_action(moves, game), policy.player)
+            player_num = 1 - player_num
+            steps += 1
+        return self.value(game, player_num)
+
+    def run_trials(self, game, moves, seed, trials):
+        """
+        Results of the given trials of each move, as one list per move.
+        """
+        if not self.workers:
+            return [[self.rollout(game, move, seed, trial) for trial in trials] for move in moves]
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_rollout_worker,
+                                             initargs=(self.player, self.model, self.heuristic, self.horizon))
+        # split the trials of every move over the workers
+        chunk = max(1, math.ceil(len(trials) / self.workers))
+        tasks = [(game, move, seed, trials[start:start + chunk])
+                 for move in moves for start in range(0, len(trials), chunk)]
+        results = self.pool.map(_rollout_trials, tasks)
+        per_move = len(tasks) // len(moves)
+        return [sum(results[i * per_move:(i + 1) * per_move], []) for i in range(len(moves))]
+
+    def prune(self, alive, results):
+        """
+        The moves of alive that may still beat the best one so far by tolerance.
+        """
+        best = max(alive, key=lambda i: np.mean(results[i]))
+        kept = []
+        for i in alive:
+            # same dice in trial k of every move, so compare the moves trial by trial
+            diff = np.asarray(results[i]) - np.asarray(results[best])
+            error = diff.std(ddof=1) / math.sqrt(len(diff)) if len(diff) > 1 else math.inf
+            if i == best or diff.mean() + self.z * error >= self.tolerance:
+                kept.append(i)
+        return kept
+
+    def close(self):
+        """
+        Stop the worker processes, if any.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+# Agent of a rollout worker process, built once by _init_rollout_worker
+_worker_agent = None
+
+
+def _init_rollout_worker(player, model, heuristic, horizon):
+    global _worker_agent
+    _worker_agent = RolloutAgent(player, model, heuristic, horizon=horizon)
+
+
+def _rollout_trials(task):
+    game, move, seed, trials = task
+    return [_worker_agent.rollout(game, move, seed, trial) for trial in trials]
@@ -1,28 +1,41 @@
+import time
+
 import numpy as np
 
+from .. import profiling
+from ..bearoff import best_bearoff_action
+from ..eval_cache import EvaluationCache
+
 class TDAgent(object):
 
-    def __init__(self, player, model):
+    def __init__(self, player, model, bearoff=True):
         self.player = player
         self.model = model
         self.name = 'TD-Gammon'
+        # Play bear-off races from the bear-off database
+        self.bearoff = bearoff
 
     def get_action(self, actions, game):
         """
         Return best action according to self.evaluationFunction,
-        with no lookahead.
+        with no lookahead. All afterstates are scored in one batch.
         """
-        v_best = 0
-        a_best = None
+        if not actions:
+            return None
+        if self.bearoff:
+            action = best_bearoff_action(game, actions, self.player)
+            if action is not None:
+                return action
 
-        for a in actions:
-            ateList = game.take_action(a, self.player)
-            features = game.extract_features(game.opponent(self.player))
-            v = self.model(features)
-            v = 1. - v if self.player == game.players[0] else v
-            if v > v_best:
-                v_best = v
-                a_best = a
-            game.undo_action(a, self.player, ateList)
+        actions = list(actions)
+        if isinstance(self.model, EvaluationCache):
+            v = self.model.predict_afterstates(game, actions, self.player)
+        else:
+            features = game.extract_afterstate_features(actions, self.player)
+            start = time.perf_counter()
+            v = np.asarray(self.model.predict_batch(features.astype(np.float32))).reshape(-1)
+            if profiling.active is not None:
+                profiling.active.add_time('model', time.perf_counter() - start, len(actions))
+        v = 1. - v if self.player == game.players[0] else v
 
-        return a_best
+        return actions[int(np.argmax(v))]
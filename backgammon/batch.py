@@ -0,0 +1,155 @@
+import array
+
+import numpy as np
+
+from .cache import LRUCache
+from .game import Game
+
+
+class RandomPolicy(object):
+    """
+    Batched RandomAgent: a uniformly random move in every game.
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def choose(self, afterstates, counts, turn):
+        return (self.rng.random(len(counts)) * counts).astype(np.int64)
+
+
+class TDPolicy(object):
+    """
+    Batched TDAgent: the move with the best network value in every game,
+    with the afterstates of all games scored in one predict_batch call.
+    model is a model.Model or a NumpyModel.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def choose(self, afterstates, counts, turn):
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        player = np.repeat(turn, counts)
+        # the opponent moves next in every afterstate
+        features = Game.extract_features_batch(afterstates[:, :Game.NUMSLOTS], afterstates[:, Game.NUMSLOTS:],
+                                               1 - player)
+        v = np.asarray(self.model.predict_batch(features.astype(np.float32))).reshape(-1)
+        # the network gives the chance that player 1 wins
+        v = np.where(player == 0, 1. - v, v)
+
+        # first best move of each game, like np.argmax in TDAgent
+        best = np.repeat(np.maximum.reduceat(v, offsets[:-1]), counts)
+        first = np.where(v == best, np.arange(len(v)), len(v))
+        return np.minimum.reduceat(first, offsets[:-1]) - offsets[:-1]
+
+
+class BatchGame(object):
+    """
+    Many games from the starting position, played together. The positions
+    live in NumPy arrays laid out like Game.signature(): boards (N, NUMSLOTS)
+    signed counts and off (N, 2) checkers borne off by Game.TOKENS[0] and [1].
+    Each step rolls the dice of all unfinished games at once, finds the
+    positions every move leads to (per game, with Game.generate_afterstates,
+    cached across games) and lets a policy per player pick one move in each
+    game in one call. Players and dice are drawn from rng, a NumPy Generator.
+    """
+
+    # (signature, smaller die, larger die, player) -> (moves, (K, NUMSLOTS + 2) afterstates)
+    afterstate_cache = LRUCache(maxsize=100000)
+
+    def __init__(self, num_games, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        start = Game.new()
+        self.boards = np.tile(np.frombuffer(start.board, dtype=np.int8), (num_games, 1))
+        self.off = np.zeros((num_games, 2), dtype=np.int8)
+        # index of the player to move, the first one at random like Game.play
+        self.turn = self.rng.integers(0, 2, num_games)
+        self.winner = np.full(num_games, -1)
+        self.turns = np.zeros(num_games, dtype=np.int64)
+        self._game = start
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def active(self):
+        return self.winner < 0
+
+    def features(self, games=None):
+        """
+        Game.extract_features of the given games (default: all), with the
+        player to move, as an (N, NUM_FEATURES) matrix.
+        """
+        games = slice(None) if games is None else games
+        return Game.extract_features_batch(self.boards[games], self.off[games], self.turn[games])
+
+    def afterstates(self, index, roll):
+        """
+        (moves, afterstates) of game index with roll: the legal moves and the
+        (K, NUMSLOTS + 2) positions they lead to, as signature bytes.
+        """
+        player = Game.TOKENS[self.turn[index]]
+        signature = self.boards[index].tobytes() + self.off[index].tobytes()
+        key = (signature, min(roll), max(roll), player)
+        entry = self.afterstate_cache.get(key)
+        if entry is None:
+            game = self._game
+            game.board = array.array('b', signature[:Game.NUMSLOTS])
+            game.off = {Game.TOKENS[0]: int(self.off[index, 0]), Game.TOKENS[1]: int(self.off[index, 1])}
+            found = game.generate_afterstates(roll, player)
+            afterstates = np.frombuffer(b''.join(found), dtype=np.int8).reshape(-1, Game.NUMSLOTS + 2)
+            entry = (list(found.values()), afterstates)
+            self.afterstate_cache.put(key, entry)
+        return entry
+
+    def step(self, policies):
+        """
+        Play one half-move in every unfinished game: policies[p] picks the
+        moves of Game.TOKENS[p]. Returns the indices of the games played.
+        """
+        games = np.flatnonzero(self.active)
+        dice = self.rng.integers(1, 7, (len(games), 2))
+        entries = [self.afterstates(i, tuple(roll)) for i, roll in zip(games.tolist(), dice.tolist())]
+        counts = np.array([len(moves) for moves, _ in entries], dtype=np.int64)
+
+        for p in range(2):
+            # games where player p has at least one move; the others just pass
+            mine = np.flatnonzero((self.turn[games] == p) & (counts > 0))
+            if not len(mine):
+                continue
+            afterstates = np.concatenate([entries[j][1] for j in mine])
+            choice = policies[p].choose(afterstates, counts[mine], np.full(len(mine), p))
+            chosen = np.concatenate(([0], np.cumsum(counts[mine])[:-1])) + choice
+            self.boards[games[mine]] = afterstates[chosen, :Game.NUMSLOTS]
+            self.off[games[mine]] = afterstates[chosen, Game.NUMSLOTS:]
+
+        self.turns[games] += 1
+        self.turn[games] = 1 - self.turn[games]
+        for p in range(2):
+            self.winner[games[self.off[games, p] == 15]] = p
+        return games
+
+    def play(self, policies, record=False):
+        """
+        Play all games to the end. Returns the winner of every game and, with
+        record, the features of every position of every game with the player
+        to move (float32, one row per half-move plus the final position, like
+        selfplay.play_self_play_game).
+        """
+        rows, owners = [], []
+        if record:
+            rows.append(self.features().astype(np.float32))
+            owners.append(np.arange(len(self)))
+        while self.active.any():
+            games = self.step(policies)
+            if record:
+                rows.append(self.features(games).astype(np.float32))
+                owners.append(games)
+        if not record:
+            return self.winner
+
+        rows, owners = np.concatenate(rows), np.concatenate(owners)
+        order = np.argsort(owners, kind='stable')
+        ends = np.cumsum(np.bincount(owners, minlength=len(self)))[:-1]
+        return self.winner, np.split(rows[order], ends)
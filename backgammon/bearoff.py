@@ -0,0 +1,180 @@
+"""
+One-sided bear-off database: the expected number of rolls a player needs to
+bear off all checkers from the home board, playing to minimize it, for every
+position of at most 15 checkers on the 6 home points.
+
+Positions are counts of checkers per point by distance from the edge,
+(checkers 1 point away, ..., checkers 6 points away). The moves follow this
+game's rules (see Game.generate_actions and Game.remove_piece): a checker
+can always be borne off with a die larger than its distance, and as many
+dice as possible must be played, the larger one if only one can be.
+
+The table is a float32 .npy file, memory mapped when loaded. Rebuild it with
+python -m backgammon.bearoff
+"""
+import math
+import os
+
+import numpy as np
+
+POINTS = 6
+MAX_CHECKERS = 15
+NUM_POSITIONS = math.comb(MAX_CHECKERS + POINTS, POINTS)
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bearoff.npy')
+
+# _OFFSETS[i][budget][c]: number of positions, in index order, that come before
+# the ones with c checkers on point i when budget checkers are left for points i..5
+_OFFSETS = [[[sum(math.comb(budget - v + POINTS - i - 1, POINTS - i - 1) for v in range(c))
+              for c in range(budget + 1)] for budget in range(MAX_CHECKERS + 1)] for i in range(POINTS)]
+
+
+def position_index(position):
+    """
+    Index of a position in the table (positions in lexicographic order).
+    """
+    index = 0
+    budget = MAX_CHECKERS
+    for i, c in enumerate(position):
+        index += _OFFSETS[i][budget][c]
+        budget -= c
+    return index
+
+
+def all_positions(points=POINTS, budget=MAX_CHECKERS):
+    """
+    All positions of at most budget checkers, in index order.
+    """
+    if points == 0:
+        yield ()
+        return
+    for c in range(budget + 1):
+        for rest in all_positions(points - 1, budget - c):
+            yield (c,) + rest
+
+
+def _die_moves(position, d, memo):
+    """
+    Positions after playing a single die d: a checker moves d points closer,
+    or is borne off if it is d points away or less.
+    """
+    key = (position, d)
+    moves = memo.get(key)
+    if moves is None:
+        moves = set()
+        for k, n in enumerate(position):
+            if n:
+                after = list(position)
+                after[k] -= 1
+                if k >= d:
+                    after[k - d] += 1
+                moves.add(tuple(after))
+        memo[key] = moves
+    return moves
+
+
+def _play_dice(position, dice, memo):
+    """
+    Positions reached by playing the dice in order, with the most dice played.
+    Returns (dice played, positions).
+    """
+    frontier = {position}
+    for played, d in enumerate(dice):
+        moves = set()
+        for p in frontier:
+            moves |= _die_moves(p, d, memo)
+        if not moves:
+            return played, frontier
+        frontier = moves
+    return len(dice), frontier
+
+
+def roll_moves(position, roll, memo=None):
+    """
+    Positions a player can reach from position with roll.
+    """
+    memo = {} if memo is None else memo
+    big, small = max(roll), min(roll)
+    if big == small:
+        return _play_dice(position, (big,) * 4, memo)[1]
+    big_played, big_first = _play_dice(position, (big, small), memo)
+    small_played, small_first = _play_dice(position, (small, big), memo)
+    if big_played == 1 and small_played <= 1:
+        # only one die can be played, the larger one
+        return big_first
+    moves = set()
+    if big_played == 2:
+        moves |= big_first
+    if small_played == 2:
+        moves |= small_first
+    return moves
+
+
+def generate():
+    """
+    Expected number of rolls to bear off from every position, as a float32 array.
+    """
+    rolls = [((d1, d2), 1 if d1 == d2 else 2) for d1 in range(1, 7) for d2 in range(d1, 7)]
+    positions = list(all_positions())
+    expected = np.zeros(NUM_POSITIONS)
+    memo = {}
+    # every move lowers the pip count, so the positions reached are done first
+    for index in sorted(range(NUM_POSITIONS), key=lambda i: sum((k + 1) * c for k, c in enumerate(positions[i]))):
+        position = positions[index]
+        if not any(position):
+            continue
+        total = 0.
+        for roll, weight in rolls:
+            total += weight * min(expected[position_index(p)] for p in roll_moves(position, roll, memo))
+        expected[index] = 1. + total / 36.
+    return expected.astype(np.float32)
+
+
+class BearoffDatabase(object):
+    """
+    Lookups in a generated table.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.table = np.load(path, mmap_mode='r')
+        if len(self.table) != NUM_POSITIONS:
+            raise ValueError('%s holds %d positions, expected %d' % (path, len(self.table), NUM_POSITIONS))
+
+    def expected_rolls(self, position):
+        return float(self.table[position_index(position)])
+
+
+_default = None
+
+
+def default_database():
+    """
+    The database at DEFAULT_PATH, generated and saved first if it is missing.
+    """
+    global _default
+    if _default is None:
+        if not os.path.exists(DEFAULT_PATH):
+            np.save(DEFAULT_PATH, generate())
+        _default = BearoffDatabase(DEFAULT_PATH)
+    return _default
+
+
+def best_bearoff_action(game, actions, player):
+    """
+    The action leaving player the fewest expected rolls to bear off, or None
+    if the game is not a pure bear-off race (see Game.bearoff_expected_rolls).
+    """
+    if not actions or game.bearoff_expected_rolls(player) is None:
+        return None
+    best_action, best_rolls = None, math.inf
+    for action in actions:
+        ateList = game.take_action(action, player)
+        rolls = game.bearoff_expected_rolls(player)
+        game.undo_action(action, player, ateList)
+        if rolls < best_rolls:
+            best_action, best_rolls = action, rolls
+    return best_action
+
+
+if __name__ == '__main__':
+    np.save(DEFAULT_PATH, generate())
+    print('Wrote %d positions to %s' % (NUM_POSITIONS, DEFAULT_PATH))
@@ -0,0 +1,116 @@
+"""
+Dice streams for Game: where its rolls and the choice of the first player
+come from.
+
+Dice draws from a random.Random, or from the global random module by
+default, as Game always did. BlockDice draws rolls from a NumPy Generator
+in blocks, DiceSequence plays back pre-rolled dice and StratifiedDice
+spreads the first rolls of a set of rollouts evenly over all rolls.
+
+Because the dice come from their own stream, two games given equally
+seeded dice see the same rolls whatever the agents do with their own
+random numbers, e.g. to compare two agents with common random numbers:
+
+    for agents in (agents_a, agents_b):
+        Game.new(Dice(random.Random(7))).play(agents)
+"""
+import random
+
+import numpy as np
+
+
+class Dice(object):
+
+    def __init__(self, rng=None):
+        # None for the global random, so games holding the dice can be pickled
+        self.rng = rng
+
+    def roll(self, die=6):
+        rng = self.rng if self.rng is not None else random
+        return (rng.randint(1, die), rng.randint(1, die))
+
+    def first_player(self):
+        """
+        Index of the player who starts.
+        """
+        rng = self.rng if self.rng is not None else random
+        return rng.randint(0, 1)
+
+
+class BlockDice(Dice):
+    """
+    Rolls from a NumPy Generator, block rolls at a time.
+    """
+
+    def __init__(self, rng=None, block=4096):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block = block
+        self.rolls = []
+        self.next = 0
+
+    def roll(self, die=6):
+        if self.next == len(self.rolls):
+            self.rolls = list(map(tuple, self.rng.integers(1, die + 1, (self.block, 2)).tolist()))
+            self.next = 0
+        roll = self.rolls[self.next]
+        self.next += 1
+        return roll
+
+    def first_player(self):
+        return int(self.rng.integers(0, 2))
+
+
+class DiceSequence(Dice):
+    """
+    Plays back the given rolls in order; first is the index of the player
+    who starts.
+    """
+
+    def __init__(self, rolls, first=0):
+        self.rolls = [tuple(roll) for roll in rolls]
+        self.first = first
+        self.next = 0
+
+    def roll(self, die=6):
+        if self.next == len(self.rolls):
+            raise ValueError('All %d rolls of the sequence were played' % len(self.rolls))
+        roll = self.rolls[self.next]
+        self.next += 1
+        return roll
+
+    def first_player(self):
+        return self.first
+
+
+class StratifiedDice(Dice):
+    """
+    Dice of trial number trial of a set of rollouts. Its first rolls are
+    quasi-random: in every block of 36 trials (0-35, 36-71, ...), each of
+    them is every one of the 36 rolls exactly once, in a different order for
+    each roll (see STEPS). The later rolls come from rng.
+    """
+
+    ROLLS = [(d1, d2) for d1 in range(1, 7) for d2 in range(1, 7)]
+    # steps prime to 36, so trial * step runs through all rolls every 36 trials
+    STEPS = (1, 5, 7, 11, 13, 17)
+
+    def __init__(self, trial, rng=None, rolls=2):
+        self.trial = trial
+        self.rng = rng
+        self.rolls = min(rolls, len(self.STEPS))
+        self.next = 0
+
+    def roll(self, die=6):
+        if self.next < self.rolls and die == 6:
+            roll = self.ROLLS[(self.trial * self.STEPS[self.next] + self.trial // 36) % 36]
+            self.next += 1
+            return roll
+        return Dice.roll(self, die)
+
+
+def streams(seed, n, block=4096):
+    """
+    n BlockDice with independent streams derived from seed, e.g. one per
+    worker process, the same for the same seed.
+    """
+    return [BlockDice(np.random.default_rng(child), block) for child in np.random.SeedSequence(seed).spawn(n)]
@@ -0,0 +1,101 @@
+import os
+import time
+
+import numpy as np
+
+from . import profiling
+from .cache import LRUCache
+
+
+class EvaluationCache(object):
+    """
+    Bounded LRU cache of position values in front of an evaluator: a
+    HeuristicEvaluator (see evaluate) or a TD network (model.Model or
+    NumpyModel, see predict_afterstates). Positions are keyed by their
+    Zobrist hash (Game.zobrist_hash) combined with the side the value is
+    for, so one cache can serve many games, e.g. all games of a tournament.
+
+    The cache can be saved to and loaded from an .npz file. Its values are
+    only valid for the same evaluator (same heuristic or network weights).
+    """
+
+    def __init__(self, evaluator, maxsize=100000, path=None):
+        self.evaluator = evaluator
+        self.cache = LRUCache(maxsize)
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def evaluate(self, game, player=None):
+        """
+        HeuristicEvaluator.evaluate, cached. player is the side scored.
+        """
+        player = player or self.evaluator.player
+        key = game.zobrist_hash(player)
+        value = self.cache.get(key)
+        if value is None:
+            value = self.evaluator.evaluate(game, player)
+            self.cache.put(key, value)
+        elif profiling.active is not None:
+            profiling.active.count('eval_cache_hits')
+        return value
+
+    def value_range(self):
+        return self.evaluator.value_range()
+
+    def predict_afterstates(self, game, actions, player):
+        """
+        Network output for the position after player plays each of actions,
+        with the opponent to move, as TDAgent scores them. Only the positions
+        missing from the cache go through the network, in one batch.
+        """
+        opponent = game.opponent(player)
+        keys = []
+        for action in actions:
+            ateList = game.take_action(action, player)
+            keys.append(game.zobrist_hash(opponent))
+            game.undo_action(action, player, ateList)
+
+        values = np.empty(len(actions))
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                values[i] = value
+        if profiling.active is not None:
+            profiling.active.count('eval_cache_hits', len(actions) - len(missing))
+        if missing:
+            features = game.extract_afterstate_features([actions[i] for i in missing], player)
+            start = time.perf_counter()
+            outputs = np.asarray(self.evaluator.predict_batch(features.astype(np.float32))).reshape(-1)
+            if profiling.active is not None:
+                profiling.active.add_time('model', time.perf_counter() - start, len(missing))
+            for i, value in zip(missing, outputs):
+                values[i] = value
+                self.cache.put(keys[i], float(value))
+        return values
+
+    @property
+    def hit_rate(self):
+        return self.cache.hit_rate
+
+    def stats(self):
+        return self.cache.stats()
+
+    def save(self, path=None):
+        """
+        Write the cached values to path (default: the path it was created with).
+        """
+        items = self.cache.items()
+        np.savez(path or self.path, keys=np.array([key for key, _ in items], dtype=np.uint64),
+                 values=np.array([value for _, value in items], dtype=np.float64))
+
+    def load(self, path):
+        """
+        Add the values saved in path, keeping the order they were used in.
+        """
+        with np.load(path) as data:
+            for key, value in zip(data['keys'].tolist(), data['values'].tolist()):
+                self.cache.put(key, value)
@@ -1,6 +1,6 @@
+import array
 import itertools
 import os
-import copy
 import time
 import random
 
@@ -8,6 +8,23 @@ from typing import List
 
 import numpy as np
 
+from . import bearoff, profiling
+from .cache import LRUCache
+from .dice import Dice
+
+
+def _zobrist_keys(num_slots, seed=0x5eed):
+    """
+    One random 64-bit key per (slot, signed count) for the board slots and
+    per (player, count) for the off counts. Count 0 gets key 0, so empty
+    slots don't change the hash.
+    """
+    rng = random.Random(seed)
+    keys = [[rng.getrandbits(64) if n != 15 else 0 for n in range(31)] for _ in range(num_slots)]
+    keys += [[rng.getrandbits(64) if n else 0 for n in range(16)] for _ in range(2)]
+    side = [rng.getrandbits(64) for _ in range(2)]
+    return keys, side
+
 class Game:
 
     LAYOUT = "0-2-o,5-5-x,7-3-x,11-5-o,12-5-x,16-3-o,18-5-o,23-2-x"
@@ -17,32 +34,51 @@ class Game:
     ON = 'on'
     TOKENS = ['x', 'o']
 
-    def __init__(self, layout=LAYOUT, grid=None, off_pieces=None, bar_pieces=None, num_pieces=None, players=None):
+    # Board layout: slots 0..23 are the points, followed by one bar slot per player.
+    # Counts are signed, positive for TOKENS[0] and negative for TOKENS[1].
+    NUMSLOTS = NUMCOLS + 2
+    SIGN = {'x': 1, 'o': -1}
+    # extract_features: 6 units per point plus bar and off for each player, then the turn
+    NUM_FEATURES = 2 * (NUMCOLS * 6 + 2) + 2
+    # extract_features units of a point holding n checkers of one player
+    POINT_UNITS = np.array([[1. if n > i else 0. for i in range(5)] + [max(n - 5, 0)] for n in range(16)])
+    BAR = {'x': NUMCOLS, 'o': NUMCOLS + 1}
+
+    # Zobrist keys, see zobrist_hash
+    ZOBRIST, ZOBRIST_SIDE = _zobrist_keys(NUMSLOTS)
+
+    # Legal moves keyed by (position, roll, player), shared by every game
+    # and agent in the process. Set to None to always regenerate.
+    move_cache = LRUCache(maxsize=10000)
+
+    def __init__(self, layout=LAYOUT, board=None, off=None, num_pieces=None, players=None, dice=None):
         """
-        Define a new game object
+        Define a new game object. dice (a backgammon.dice.Dice) rolls the
+        dice and picks the first player, by default from the global random.
         """
         self.die = Game.QUAD
         self.layout = layout
-        if grid:
-            self.grid = copy.deepcopy(grid)
-            self.off_pieces = copy.deepcopy(off_pieces)
-            self.bar_pieces = copy.deepcopy(bar_pieces)
-            self.num_pieces = copy.deepcopy(num_pieces)
+        self.dice = dice if dice is not None else Dice()
+        if board is not None:
+            self.board = array.array('b', board)
+            self.off = dict(off)
+            self.num_pieces = dict(num_pieces)
             self.players = players
+            self.features = None
             return
         self.players = Game.TOKENS
-        self.grid = [[] for _ in range(Game.NUMCOLS)]
-        self.off_pieces = {}
-        self.bar_pieces = {}
+        self.board = array.array('b', bytes(Game.NUMSLOTS))
+        self.off = {}
         self.num_pieces = {}
+        # live extract_features vector, see track_features
+        self.features = None
         for t in self.players:
-            self.bar_pieces[t] = []
-            self.off_pieces[t] = []
+            self.off[t] = 0
             self.num_pieces[t] = 0
 
     @staticmethod
-    def new():
-        game = Game()
+    def new(dice=None):
+        game = Game(dice=dice)
         game.reset()
         return game
 
@@ -54,29 +90,145 @@ class Game:
     def get_possible_doubles():
         return [(i, i) for i in range(1, 7)]
 
+    @property
+    def grid(self):
+        """
+        Token-list view of the points, e.g. ['x', 'x'] for two 'x' checkers.
+        Built on demand from the board, only meant for drawing and display.
+        """
+        return [[Game.TOKENS[0] if n > 0 else Game.TOKENS[1]] * abs(n)
+                for n in self.board[:Game.NUMCOLS]]
+
+    def bar_count(self, player):
+        return abs(self.board[Game.BAR[player]])
+
+    def off_count(self, player):
+        return self.off[player]
+
+    def count(self, i, player):
+        """
+        Number of checkers player has on point i.
+        """
+        n = self.board[i] * Game.SIGN[player]
+        return n if n > 0 else 0
 
     def extract_features(self, player):
+        profile = profiling.active
+        if profile is None:
+            return self._extract_features(player)
+        with profile.timer('extract_features'):
+            return self._extract_features(player)
+
+    def _extract_features(self, player):
+        if self.features is not None:
+            features = self.features.copy()
+            features[-2:] = (1., 0.) if player == self.players[0] else (0., 1.)
+            return features.reshape(1, -1)
+
         features = []
         for p in self.players:
-            for col in self.grid:
+            sign = Game.SIGN[p]
+            for n in self.board[:Game.NUMCOLS]:
                 feats = [0.] * 6
-                if len(col) > 0 and col[0] == p:
-                    for i in range(len(col)):
-                        feats[min(i, 5)] += 1
+                n *= sign
+                for i in range(n):
+                    feats[min(i, 5)] += 1
                 features += feats
-            features.append(float(len(self.bar_pieces[p])) / 2.)
-            features.append(float(len(self.off_pieces[p])) / self.num_pieces[p])
+            features.append(float(self.bar_count(p)) / 2.)
+            features.append(float(self.off[p]) / self.num_pieces[p])
         if player == self.players[0]:
             features += [1., 0.]
         else:
             features += [0., 1.]
         return np.array(features).reshape(1, -1)
 
+    def track_features(self):
+        """
+        Keep a live copy of the features that take_action and undo_action
+        update for the points they touch, so extract_features doesn't have
+        to rebuild it from the whole board.
+        """
+        self.features = None
+        self.features = self._extract_features(self.players[0])[0]
+        return self
+
+    def _update_features(self, slots):
+        """
+        Rewrite the tracked features of the given board slots and of the off counts.
+        """
+        features = self.features
+        width = Game.NUMCOLS * 6
+        for p, t in enumerate(self.players):
+            base = p * (width + 2)
+            sign = Game.SIGN[t]
+            for i in slots:
+                if i < Game.NUMCOLS:
+                    n = self.board[i] * sign
+                    features[base + 6 * i:base + 6 * i + 6] = Game.POINT_UNITS[n if n > 0 else 0]
+            features[base + width] = float(self.bar_count(t)) / 2.
+            features[base + width + 1] = float(self.off[t]) / self.num_pieces[t]
+
+    @staticmethod
+    def extract_features_batch(boards, off, turn, num_pieces=(15, 15)):
+        """
+        extract_features for many positions at once, bit for bit the same.
+        boards: (N, NUMSLOTS) signed counts laid out like Game.board,
+        off: (N, 2) checkers borne off per player, turn: (N,) index of the
+        player to move. Returns an (N, NUM_FEATURES) float64 matrix.
+        """
+        boards = np.asarray(boards, dtype=np.int8).reshape(-1, Game.NUMSLOTS)
+        off = np.asarray(off, dtype=np.float64).reshape(-1, 2)
+        turn = np.asarray(turn).reshape(-1)
+        n = len(boards)
+
+        # (N, 2, NUMCOLS) checkers of each player on each point
+        points = boards[:, :Game.NUMCOLS].astype(np.int64)
+        counts = np.stack([np.maximum(points * Game.SIGN[t], 0) for t in Game.TOKENS], axis=1)
+        # units 0..4 are set by the 1st..5th checker, unit 5 counts the rest
+        units = np.empty(counts.shape + (6,))
+        units[..., :5] = counts[..., None] > np.arange(5)
+        units[..., 5] = np.maximum(counts - 5, 0)
+
+        features = np.empty((n, Game.NUM_FEATURES))
+        width = Game.NUMCOLS * 6
+        for p, t in enumerate(Game.TOKENS):
+            base = p * (width + 2)
+            features[:, base:base + width] = units[:, p].reshape(n, width)
+            features[:, base + width] = np.abs(boards[:, Game.BAR[t]]) / 2.
+            features[:, base + width + 1] = off[:, p] / num_pieces[p]
+        features[:, -2] = turn == 0
+        features[:, -1] = turn == 1
+        return features
+
+    def extract_afterstate_features(self, actions, player):
+        """
+        Feature matrix with one row per action: the position after player
+        plays it, encoded by extract_features with the opponent to move.
+        """
+        profile = profiling.active
+        start = time.perf_counter() if profile is not None else None
+        opponent = self.opponent(player)
+        boards = np.empty((len(actions), Game.NUMSLOTS), dtype=np.int8)
+        off = np.empty((len(actions), 2))
+        # the batch encoder beats updating tracked features on every take/undo
+        tracked, self.features = self.features, None
+        for i, action in enumerate(actions):
+            ateList = self.take_action(action, player)
+            boards[i] = np.frombuffer(self.board, dtype=np.int8)
+            off[i] = self.off[self.players[0]], self.off[self.players[1]]
+            self.undo_action(action, player, ateList)
+        self.features = tracked
+        turn = np.full(len(actions), self.players.index(opponent))
+        features = Game.extract_features_batch(boards, off, turn, [self.num_pieces[t] for t in self.players])
+        if profile is not None:
+            profile.add_time('extract_features', time.perf_counter() - start, len(actions))
+        return features
+
     def roll_dice(self):
-        return (random.randint(1, self.die), random.randint(1, self.die))
+        return self.dice.roll(self.die)
 
     def play(self, players, draw=False):
-        player_num = random.randint(0, 1)
+        player_num = self.dice.first_player()
         while not self.is_over():
             self.next_step(players[player_num], player_num, draw=draw)
             # self.reverse()
@@ -97,7 +249,12 @@ class Game:
             # time.sleep(1)
 
         moves = self.get_actions(roll, player.player, nodups=True)
-        move = player.get_action(moves, self) if moves else None
+        profile = profiling.active
+        if profile is None:
+            move = player.get_action(moves, self) if moves else None
+        else:
+            with profile.agent('%s (%s)' % (player.name, player.player)), profile.timer('get_action'):
+                move = player.get_action(moves, self) if moves else None
 
         if move:
             self.take_action(move, player.player)
@@ -107,29 +264,40 @@ class Game:
         Return an exact copy of the game. Changes can be made
         to the cloned version without affecting the original.
         """
-        return Game(None, self.grid, self.off_pieces,
-                    self.bar_pieces, self.num_pieces, self.players)
+        profile = profiling.active
+        start = time.perf_counter() if profile is not None else None
+        game = Game(None, self.board, self.off, self.num_pieces, self.players, self.dice)
+        if self.features is not None:
+            game.features = self.features.copy()
+        if profile is not None:
+            profile.add_time('clone', time.perf_counter() - start)
+        return game
 
     def take_action(self, action, token):
         """
         Makes given move for player, assumes move is valid,
         will remove pieces from play
         """
+        board = self.board
+        sign = Game.SIGN[token]
+        opp_bar = Game.BAR[self.opponent(token)]
         ateList = [0] * 4
         for i, (s, e) in enumerate(action):
             if s == Game.ON:
-                piece = self.bar_pieces[token].pop()
+                board[Game.BAR[token]] -= sign
             else:
-                piece = self.grid[s].pop()
+                board[s] -= sign
             if e == Game.OFF:
-                self.off_pieces[token].append(piece)
+                self.off[token] += 1
                 continue
-            if len(self.grid[e]) > 0 and self.grid[e][0] != token:
-                bar_piece = self.grid[e].pop()
-                self.bar_pieces[bar_piece].append(bar_piece)
+            if board[e] * sign < 0:
+                board[e] += sign
+                board[opp_bar] -= sign
                 ateList[i] = 1
-            self.grid[e].append(piece)
+            board[e] += sign
 
+        if self.features is not None:
+            self._update_features({p for sub_move in action for p in sub_move if p not in (Game.ON, Game.OFF)})
         return ateList
 
     def undo_action(self, action, player, ateList):
@@ -137,110 +305,208 @@ class Game:
         Reverses given move for player, assumes move is valid,
         will remove pieces from play
         """
+        board = self.board
+        sign = Game.SIGN[player]
+        opp_bar = Game.BAR[self.opponent(player)]
         for i, (s, e) in enumerate(reversed(action)):
             if e == Game.OFF:
-                piece = self.off_pieces[player].pop()
+                self.off[player] -= 1
             else:
-                piece = self.grid[e].pop()
+                board[e] -= sign
                 if ateList[len(action) - 1 - i]:
-                    bar_piece = self.bar_pieces[self.opponent(player)].pop()
-                    self.grid[e].append(bar_piece)
+                    board[opp_bar] += sign
+                    board[e] -= sign
             if s == Game.ON:
-                self.bar_pieces[player].append(piece)
+                board[Game.BAR[player]] += sign
             else:
-                self.grid[s].append(piece)
+                board[s] += sign
+
+        if self.features is not None:
+            self._update_features({p for sub_move in action for p in sub_move if p not in (Game.ON, Game.OFF)})
+
+    def signature(self):
+        """
+        Hashable snapshot of the position: the board bytes plus both off counts.
+        """
+        return bytes(self.board) + bytes((self.off[self.players[0]], self.off[self.players[1]]))
+
+    def zobrist_hash(self, player=None):
+        """
+        64-bit Zobrist hash of the position, optionally combined with a key
+        for the player to move.
+        """
+        keys = Game.ZOBRIST
+        h = keys[Game.NUMSLOTS][self.off[self.players[0]]] ^ keys[Game.NUMSLOTS + 1][self.off[self.players[1]]]
+        for i, n in enumerate(self.board):
+            if n:
+                h ^= keys[i][n + 15]
+        if player is not None:
+            h ^= Game.ZOBRIST_SIDE[self.players.index(player)]
+        return h
 
     def get_actions(self, roll, player, nodups=False):
         """
-        Get set of all possible move tuples
+        Get a tuple of all possible move tuples, in the order
+        generate_afterstates finds them (the same on every run), served from
+        Game.move_cache when the same position, roll and player were seen before.
         """
-        moves = set()
-        if nodups:
-            start = 0
-        else:
-            start = None
+        cache = Game.move_cache
+        if cache is None:
+            return self._find_actions(roll, player)
+
+        # both orders of a roll give the same moves
+        key = (self.signature(), min(roll), max(roll), player)
+        moves = cache.get(key)
+        if moves is None:
+            moves = self._find_actions(roll, player)
+            cache.put(key, moves)
+        elif profiling.active is not None:
+            profiling.active.count('move_cache_hits')
+        return moves
 
+    def generate_actions(self, roll, player, nodups=False):
+        """
+        Search all possible move tuples from scratch, keeping one move per
+        distinct resulting position. As many dice as possible must be used,
+        and the larger die when only one of them can be played.
+        """
+        return set(self._find_actions(roll, player))
+
+    def _find_actions(self, roll, player):
+        profile = profiling.active
+        if profile is None:
+            return tuple(self.generate_afterstates(roll, player).values())
+        with profile.timer('find_moves'):
+            moves = tuple(self.generate_afterstates(roll, player).values())
+        profile.count('moves_generated', len(moves))
+        return moves
+
+    def generate_afterstates(self, roll, player):
+        """
+        The moves of generate_actions keyed by the signature of the position
+        each one leads to, in the order they were found.
+        """
         r1, r2 = roll
 
         # i added
         direction = 1 if player == 'o' else -1
 
+        visited = set()
         if r1 == r2: # doubles
-            i = 4
-            # keep trying until we find some moves
-            while not moves and i > 0:
-                # i added
-                # self.find_moves(tuple([r1] * i), player, (), moves, start)
-                self.find_moves(tuple([r1 * direction]*i), player, (), moves, start)
-                i -= 1
-        else:
-            # i added
-            # self.find_moves(roll, player, (), moves, start)
-            # self.find_moves((r2, r1), player, (), moves, start)
-            self.find_moves((r1 * direction, r2 * direction), player, (), moves, start)
-            self.find_moves((r2 * direction, r1 * direction), player, (), moves, start)
-            # has no moves, try moving only one piece
-            if not moves:
-                for r in roll:
-                    self.find_moves((r * direction, ), player, (), moves, start)
+            moves = {}
+            self.find_moves(tuple([r1 * direction]*4), player, (), moves, visited)
+            return moves
+
+        big, small = max(roll) * direction, min(roll) * direction
+        big_first, small_first = {}, {}
+        self.find_moves((big, small), player, (), big_first, visited)
+        self.find_moves((small, big), player, (), small_first, visited)
+        depth = max(self._move_depth(big_first), self._move_depth(small_first))
+        if depth == 1:
+            # only one die can be played, the larger one if possible
+            return big_first or small_first
+        for sig, move in small_first.items():
+            # big_first may hold a shorter move to the same position, e.g. bearing
+            # the last checker off with the big die alone
+            if len(move) == depth and len(big_first.get(sig, ())) < depth:
+                big_first[sig] = move
+        return {sig: move for sig, move in big_first.items() if len(move) == depth}
 
-        return moves
+    @staticmethod
+    def _move_depth(moves):
+        return len(next(iter(moves.values()))) if moves else 0
 
-    def find_moves(self, rs, player, move, moves, start=None):
+    def _store_move(self, moves, move):
+        """
+        Keep move, keyed by the position it leads to, unless it plays fewer
+        dice than the moves found so far.
+        """
+        depth = self._move_depth(moves)
+        if len(move) < depth:
+            return
+        if len(move) > depth:
+            moves.clear()
+        moves.setdefault(self.signature(), move)
+
+    def find_moves(self, rs, player, move, moves, visited):
+        """
+        Depth first search over the sub-moves for the dice left in rs.
+        Finished moves go into the moves dict (see _store_move), partial
+        positions already expanded with the same dice left are skipped.
+        """
         if len(rs)==0:
-            moves.add(move)
+            self._store_move(moves, move)
             return
+        key = (self.signature(), rs)
+        if key in visited:
+            return
+        visited.add(key)
+
         r, rs = rs[0], rs[1:]
+        board = self.board
+        sign = Game.SIGN[player]
+        opp_bar = Game.BAR[self.opponent(player)]
+        moved = False
         # see if we can remove a piece from the bar
 
-        if self.bar_pieces[player]:
-            index = r-1
+        bar = Game.BAR[player]
+        if board[bar]:
             if self.can_onboard(player, r):
-                if player == "x":
-                    index = index +1
-                piece = self.bar_pieces[player].pop()
-                bar_piece = None
+                moved = True
+                index = self.entry_point(player, r)
+                hit = board[index] * sign < 0
 
-                if len(self.grid[index]) == 1 and self.grid[index][-1]!=player:
-                    bar_piece = self.grid[index].pop()
+                board[bar] -= sign
+                if hit:
+                    board[opp_bar] -= sign
+                board[index] = sign if hit else board[index] + sign
 
-                self.grid[index].append(piece)
+                self.find_moves(rs, player, move+((Game.ON, index), ), moves, visited)
 
-                self.find_moves(rs, player, move+((Game.ON, index), ), moves, start)
-
-                self.grid[index].pop()
-                self.bar_pieces[player].append(piece)
-                if bar_piece:
-                    self.grid[index].append(bar_piece)
+                board[index] = -sign if hit else board[index] - sign
+                if hit:
+                    board[opp_bar] += sign
+                board[bar] += sign
 
+            if not moved and move:
+                self._store_move(moves, move)
             return
 
         # otherwise check each grid location for valid move using r
         offboarding = self.can_offboard(player)
 
-        for i in range(len(self.grid)):
-            if start is not None:
-                start = i
-            if self.is_valid_move(i, i + r, player):
-
-                piece = self.grid[i].pop()
-                bar_piece = None
-                if len(self.grid[i+r]) == 1 and self.grid[i+r][-1] != player:
-                    bar_piece = self.grid[i + r].pop()
-                self.grid[i + r].append(piece)
-                self.find_moves(rs, player, move + ((i, i + r), ), moves, start)
-                self.grid[i + r].pop()
-                self.grid[i].append(piece)
-                if bar_piece:
-                    self.grid[i + r].append(bar_piece)
+        for i in range(Game.NUMCOLS):
+            # both a move and a bear-off need one of our checkers on i
+            if board[i] * sign <= 0:
+                continue
+            end = i + r
+            # same test as is_valid_move, r already points in our direction
+            if 0 <= end < Game.NUMCOLS and board[end] * sign >= -1:
+                moved = True
+
+                hit = board[end] * sign < 0
+                board[i] -= sign
+                if hit:
+                    board[opp_bar] -= sign
+                board[end] = sign if hit else board[end] + sign
+                self.find_moves(rs, player, move + ((i, end), ), moves, visited)
+                board[end] = -sign if hit else board[end] - sign
+                if hit:
+                    board[opp_bar] += sign
+                board[i] += sign
 
             # If we can't move on the board can we take the piece off?
             if offboarding and self.remove_piece(player, i, r):
-                piece = self.grid[i].pop()
-                self.off_pieces[player].append(piece)
-                self.find_moves(rs, player, move + ((i, Game.OFF), ), moves, start)
-                self.off_pieces[player].pop()
-                self.grid[i].append(piece)
+                moved = True
+                board[i] -= sign
+                self.off[player] += 1
+                self.find_moves(rs, player, move + ((i, Game.OFF), ), moves, visited)
+                self.off[player] -= 1
+                board[i] += sign
+
+        # no way to play this die, the move so far is complete
+        if not moved and move:
+            self._store_move(moves, move)
 
     def opponent(self, token):
         """
@@ -268,23 +534,23 @@ class Game:
         """
         for col in self.layout.split(','):
             loc, num, token = col.split('-')
-            self.grid[int(loc)] = [token for _ in range(int(num))]
-        for col in self.grid:
-            for piece in col:
-                self.num_pieces[piece] += 1
+            self.board[int(loc)] = int(num) * Game.SIGN[token]
+            self.num_pieces[token] += int(num)
+        if self.features is not None:
+            self.track_features()
 
     def winner(self):
         """
         Get winner.
         """
-        return 0 if len(self.off_pieces[self.players[0]]) == self.num_pieces[self.players[0]] else 1
+        return 0 if self.off[self.players[0]] == self.num_pieces[self.players[0]] else 1
 
     def is_over(self):
         """
         Checks if the game is over.
         """
         for t in self.players:
-            if len(self.off_pieces[t]) == self.num_pieces[t]:
+            if self.off[t] == self.num_pieces[t]:
                 return True
         return False
 
@@ -292,30 +558,52 @@ class Game:
         count = 0
         # Check the home quadrant based on the player
         if player == 'o':
-            for i in range(Game.NUMCOLS - self.die, Game.NUMCOLS):
-                if len(self.grid[i]) > 0 and self.grid[i][0] == player:
-                    count += len(self.grid[i])
+            home = self.board[Game.NUMCOLS - self.die:Game.NUMCOLS]
         else:  # player 'x'
-            for i in range(0, self.die):
-                if len(self.grid[i]) > 0 and self.grid[i][0] == player:
-                    count += len(self.grid[i])
+            home = self.board[0:self.die]
+        for n in home:
+            n *= Game.SIGN[player]
+            if n > 0:
+                count += n
 
-        if count + len(self.off_pieces[player]) == self.num_pieces[player]:
+        if count + self.off[player] == self.num_pieces[player]:
             return True
         return False
 
+    def bearoff_position(self, player):
+        """
+        Checkers player has on each home point, by distance from the edge
+        (the position format of backgammon.bearoff).
+        """
+        sign = Game.SIGN[player]
+        if player == 'o':
+            return tuple(self.board[Game.NUMCOLS - 1 - k] * sign for k in range(self.die))
+        return tuple(self.board[k] * sign for k in range(self.die))
+
+    def bearoff_expected_rolls(self, player):
+        """
+        Expected rolls player needs to bear off, from the bear-off database,
+        when both players can offboard (so they can't hit each other any more).
+        None otherwise.
+        """
+        if not (self.can_offboard(self.players[0]) and self.can_offboard(self.players[1])):
+            return None
+        return bearoff.default_database().expected_rolls(self.bearoff_position(player))
+
+    def entry_point(self, player, r):
+        """
+        Point a piece on the bar lands on when entering with (signed) roll r.
+        """
+        if player == "x":
+            return Game.NUMCOLS + r
+        return r - 1
+
     def can_onboard(self, player, r):
         """
         Can we take a players piece on the bar to a position
         on the grid given by roll-1?
         """
-        if player == "x":
-            r=r+1
-
-        if len(self.grid[r - 1]) <= 1 or self.grid[r - 1][0] == player:
-            return True
-        else:
-            return False
+        return self.board[self.entry_point(player, r)] * Game.SIGN[player] >= -1
 
     def remove_piece(self, player, start, r):
         """
@@ -323,35 +611,37 @@ class Game:
         In this function, we assume we are cool to offboard,
         i.e., no pieces on the bar and all are in the home quadrant.
         """
+        board = self.board
         if player == 'o':
             if start < Game.NUMCOLS - self.die:
                 return False
-            if len(self.grid[start]) == 0 or self.grid[start][0] != player:
+            if board[start] >= 0:
                 return False
             if start + r == Game.NUMCOLS:
                 return True
             if start + r > Game.NUMCOLS:
                 for i in range(start - 1, Game.NUMCOLS - self.die - 1, -1):
-                    if len(self.grid[i]) != 0 and self.grid[i][0] == self.players[0]:
+                    if board[i] * Game.SIGN[self.players[0]] > 0:
                         return False
                 return True
         else:  # player 'x'
             if start > self.die - 1:
                 return False
-            if len(self.grid[start]) == 0 or self.grid[start][0] != player:
+            if board[start] <= 0:
                 return False
             if start + r == -1:  # can offboard from column 0
                 return True
             if start + r < -1:
                 for i in range(start + 1, 1):  # check if there are no opponent pieces
-                    if len(self.grid[i]) != 0 and self.grid[i][0] == self.players[1]:
+                    if board[i] * Game.SIGN[self.players[1]] > 0:
                         return False
                 return True
         return False
 
     def is_valid_move(self, start, end, token):
-        if len(self.grid[start]) > 0 and self.grid[start][0] == token:
-            if end < 0 or end >= len(self.grid):
+        sign = Game.SIGN[token]
+        if self.board[start] * sign > 0:
+            if end < 0 or end >= Game.NUMCOLS:
                 return False
 
             if token == 'o' and end <= start:  # 'o' can only move forward
@@ -359,12 +649,11 @@ class Game:
             if token == 'x' and end >= start:  # 'x' can only move backward
                 return False
 
-            if len(self.grid[end]) <= 1:
-                return True
-            if len(self.grid[end]) > 1 and self.grid[end][-1] == token:
+            # empty, a single checker of either side, or one of our own blocks
+            if self.board[end] * sign >= -1:
                 return True
         return False
-    def draw_col(self, i, col):
+    def draw_col(self, grid, i, col):
         print(f'|', end='')
         if i == -2:
             if col < 10:
@@ -372,30 +661,30 @@ class Game:
             print(str(col), end='')
         elif i == -1:
             print(f'--', end='')
-        elif len(self.grid[col]) > i:
-            print(f' {self.grid[col][i]}', end='')
+        elif len(grid[col]) > i:
+            print(f' {grid[col][i]}', end='')
         else:
             print(f'  ', end='')
 
     def draw(self):
         os.system('clear')
-        largest = max([len(self.grid[i]) for i in range(len(self.grid)//2,len(self.grid))])
+        grid = self.grid
+        largest = max([len(grid[i]) for i in range(len(grid)//2,len(grid))])
         for i in range(-2,largest):
-            for col in range(len(self.grid)//2,len(self.grid)):
-                self.draw_col(i,col)
+            for col in range(len(grid)//2,len(grid)):
+                self.draw_col(grid, i,col)
             print ("|")
         print()
         print()
-        largest = max([len(self.grid[i]) for i in range(len(self.grid)//2)])
+        largest = max([len(grid[i]) for i in range(len(grid)//2)])
         for i in range(largest-1,-3,-1):
-            for col in range(len(self.grid)//2-1,-1,-1):
-                self.draw_col(i,col)
+            for col in range(len(grid)//2-1,-1,-1):
+                self.draw_col(grid, i,col)
             print ("|")
         for t in self.players:
             print( "<Player %s>  Off Board : "%(t))
-            for _ in self.off_pieces[t]:
+            for _ in range(self.off_count(t)):
                 print (t+'')
             print ("   Bar : ")
-            for _ in self.bar_pieces[t]:
+            for _ in range(self.bar_count(t)):
                 print (t+'')
-
@@ -1,3 +1,8 @@
+import time
+
+import numpy as np
+
+from . import profiling
 
 
 class HeuristicEvaluator:
@@ -9,104 +14,181 @@ class HeuristicEvaluator:
     * Blockade - A series of blocks arranged to prevent escape of the opponent's runners.
     * Prime - Several consecutive blocks
     * Anchor - A block in the opponent's home board.
+
+    All features of both sides are computed from the checkers per quadrant,
+    counted in one pass over the board (see _counts).
     """
 
+    # (feature, weight) of the player's and of the opponent's score
+    PLAYER_WEIGHTS = [
+        ('vulnerability', 0.4),
+        ('hitting', 0.4),
+        ('blocking', 0.01),
+        ('bear_in', 0.4),
+        ('bear_off', 0.4),
+        ('terminal_state', 1)]
+    OPPONENT_WEIGHTS = [
+        ('hitting', 0.4),
+        ('blocking', 0.4),
+        ('bear_in', 0.2),
+        ('bear_off', 0.2),
+        ('terminal_state', 1)]
+    # (min, max) of each feature over positions that are not over
+    FEATURE_RANGES = {
+        'vulnerability': (1 - 45 / 15, 1),  # 15 blots, 3 quadrants away
+        'hitting': (-7.5 / 15, 1),
+        'blocking': (0, 45 / 27),
+        'bear_in': (-7.5 / 15, 1),
+        'bear_off': (-1, 1),
+        'terminal_state': (0, 0),
+    }
+    # Per side: the other side, the weight of each quadrant in the vulnerability
+    # and blocking scores, and both home quadrants
+    SIDES = {
+        'o': ('x', (0, 1, 2, 3), 3, 0),
+        'x': ('o', (3, 2, 1, 0), 0, 3),
+    }
+
     def __init__(self, game, player):
+        """
+        player is the index of the token scored by default. evaluate only reads
+        the evaluator, so one instance can serve any number of searches at once.
+        """
         self.player = game.TOKENS[player]
         self.opponent = game.TOKENS[1 - player]
-        self.quadrants = None
         self.game = game
 
-    def evaluate(self, game) -> float:
+    def evaluate(self, game, player=None) -> float:
+        """
+        Score of the position for player (default: the evaluator's player).
+        """
+        profile = profiling.active
+        if profile is None:
+            return self._evaluate(game, player or self.player)
+        start = time.perf_counter()
+        value = self._evaluate(game, player or self.player)
+        profile.add_time('evaluate', time.perf_counter() - start)
+        return value
+
+    def _evaluate(self, game, player):
+        opponent = self.SIDES[player][0]
+        pieces, blocks = self._counts(game.board)
+        bar = {'x': game.bar_count('x'), 'o': game.bar_count('o')}
+        off = {'x': game.off_count('x'), 'o': game.off_count('o')}
+
+        features = self._features(pieces, blocks, bar, off, player)
+        features['terminal_state'] = self._terminal_state_score(off, player, opponent)
+        opponent_features = self._features(pieces, blocks, bar, off, opponent)
+        opponent_features['terminal_state'] = self._terminal_state_score(off, opponent, player)
+        return self._score(features, self.PLAYER_WEIGHTS) - self._score(opponent_features, self.OPPONENT_WEIGHTS)
+
+    def evaluate_batch(self, boards, off, player=None):
+        """
+        evaluate for many positions at once, with the same scores.
+        boards: (N, NUMSLOTS) signed counts laid out like Game.board,
+        off: (N, 2) checkers borne off by 'x' and 'o'. Returns (N,) scores.
+        """
+        player = player or self.player
+        opponent = self.SIDES[player][0]
+        if profiling.active is not None:
+            profiling.active.count('evaluate_batch', len(boards))
+        boards = np.asarray(boards, dtype=np.int64).reshape(len(boards), -1)
+        off = np.asarray(off, dtype=np.int64).reshape(-1, 2)
+        # (4, N) checkers per quadrant, like the lists of _counts
+        points = boards[:, :24].reshape(-1, 4, 6)
+        pieces = {'x': np.where(points > 0, points, 0).sum(2).T, 'o': np.where(points < 0, -points, 0).sum(2).T}
+        blocks = {'x': np.where(points > 1, points, 0).sum(2).T, 'o': np.where(points < -1, -points, 0).sum(2).T}
+        bar = {'x': np.abs(boards[:, 24]), 'o': np.abs(boards[:, 25])}
+        off = {'x': off[:, 0], 'o': off[:, 1]}
+
+        features = self._features(pieces, blocks, bar, off, player)
+        features['terminal_state'] = np.where(off[player] == 15, np.inf,
+                                              np.where(off[opponent] == 15, -np.inf, 0.))
+        opponent_features = self._features(pieces, blocks, bar, off, opponent)
+        opponent_features['terminal_state'] = np.where(off[opponent] == 15, np.inf,
+                                                       np.where(off[player] == 15, -np.inf, 0.))
+        return self._score(features, self.PLAYER_WEIGHTS) - self._score(opponent_features, self.OPPONENT_WEIGHTS)
+
+    def opponent_score(self, game=None, player=None) -> float:
+        """
+        The opponent's part of evaluate (subtracted from the player's).
+        """
+        game = self.game if game is None else game
+        player = player or self.player
+        opponent = self.SIDES[player][0]
+        pieces, blocks = self._counts(game.board)
+        bar = {'x': game.bar_count('x'), 'o': game.bar_count('o')}
+        off = {'x': game.off_count('x'), 'o': game.off_count('o')}
+        features = self._features(pieces, blocks, bar, off, opponent)
+        features['terminal_state'] = self._terminal_state_score(off, opponent, player)
+        return self._score(features, self.OPPONENT_WEIGHTS)
+
+    def value_range(self):
+        """
+        Lowest and highest score evaluate can give a position that is not over.
+        Won and lost positions score +inf and -inf.
+        """
+        low = sum(weight * self.FEATURE_RANGES[feature][0] for feature, weight in self.PLAYER_WEIGHTS) \
+            - sum(weight * self.FEATURE_RANGES[feature][1] for feature, weight in self.OPPONENT_WEIGHTS)
+        high = sum(weight * self.FEATURE_RANGES[feature][1] for feature, weight in self.PLAYER_WEIGHTS) \
+            - sum(weight * self.FEATURE_RANGES[feature][0] for feature, weight in self.OPPONENT_WEIGHTS)
+        return low, high
 
-        self.game = game
-        self._fill_quadrants()
-
-        return sum(feature * weight for feature, weight in [
-            (self._vulnerability_score(), 0.4),
-            (self._hitting_score(), 0.4),
-            (self._blocking_score(), 0.01),
-            (self._bear_in_score(), 0.4),
-            (self._bear_off_score(), 0.4),
-            (self._terminal_state_score(), 1)]) - self.opponent_score()
-
-    def opponent_score(self) -> float:
-        temp = self.player
-        self.player = self.opponent
-        self.opponent = temp
-        self._fill_quadrants()
-        score = sum(feature * weight for feature, weight in [
-            (self._hitting_score(), 0.4),
-            (self._blocking_score(), 0.4),
-            (self._bear_in_score(), 0.2),
-            (self._bear_off_score(), 0.2),
-            (self._terminal_state_score(), 1),
-        ])
-        temp = self.player
-        self.player = self.opponent
-        self.opponent = temp
-        return score
-
-    def _vulnerability_score(self) -> float:
-        """ Minimize the amount of blots, based on quadrants."""
-        if self.player == 'o':
-            score = sum([self._count_blots(self.quadrants[i]) * i for i in range(0, 4)])
-        else:
-            score = sum([self._count_blots(self.quadrants[i]) * (3-i) for i in range(0, 4)])
-        return 1 - self._normalize(score, 0, 15)
+    @staticmethod
+    def _score(features, weights):
+        return sum(features[feature] * weight for feature, weight in weights)
+
+    @staticmethod
+    def _counts(board):
+        """
+        Checkers (pieces) and checkers on blocks (blocks) in each quadrant, per player.
+        """
+        pieces = {'x': [0] * 4, 'o': [0] * 4}
+        blocks = {'x': [0] * 4, 'o': [0] * 4}
+        for q in range(4):
+            x_pieces = x_blocks = o_pieces = o_blocks = 0
+            for n in board[q * 6:q * 6 + 6]:
+                if n > 0:
+                    x_pieces += n
+                    if n > 1:
+                        x_blocks += n
+                elif n < 0:
+                    o_pieces -= n
+                    if n < -1:
+                        o_blocks -= n
+            pieces['x'][q], blocks['x'][q] = x_pieces, x_blocks
+            pieces['o'][q], blocks['o'][q] = o_pieces, o_blocks
+        return pieces, blocks
+
+    def _features(self, pieces, blocks, bar, off, player):
+        """
+        Features of player other than the terminal state score. Works on plain
+        counts as well as on arrays of counts of many positions.
+        """
+        opponent, weights, home, opponent_home = self.SIDES[player]
+        return {
+            # Minimize the amount of blots, based on quadrants.
+            'vulnerability': 1 - self._normalize(sum([pieces[player][i] * weights[i] for i in range(0, 4)]), 0, 15),
+            # Maximize the amount of the eaten opponent's checkers
+            'hitting': self._normalize(bar[opponent] - bar[player] / 2, 0, 15),
+            # Maximize the amount of blocks, based on quadrants.  TODO: consider anchors
+            'blocking': self._normalize(sum([blocks[player][i] * weights[i] for i in range(0, 4)]), 0, 27),
+            # Maximize the amount of checkers inside home board
+            'bear_in': self._normalize(pieces[player][home] - pieces[opponent][opponent_home] / 2, 0, 15),
+            # Maximize the amount of checkers borne off
+            'bear_off': self._normalize(off[player] - off[opponent], 0, 15),
+        }
 
-    def _terminal_state_score(self) -> float:
+    @staticmethod
+    def _terminal_state_score(off, player, opponent) -> float:
         """ Evaluates a terminal state """
-        if len(self.game.off_pieces[self.player]) == 15:
+        if off[player] == 15:
             return float('inf')
-        if len(self.game.off_pieces[self.opponent]) == 15:
+        if off[opponent] == 15:
             return float('-inf')
         else:
             return 0
 
-    def _hitting_score(self) -> float:
-        """ Maximize the amount of the eaten opponent's checkers """
-        score = len(self.game.bar_pieces[self.opponent]) - len(self.game.bar_pieces[self.player])/2
-        return self._normalize(score, 0, 15)
-
-    def _blocking_score(self) -> float:
-        """ Maximize the amount of blocks, based on quadrants. """
-        if self.player == 'o':
-            score = sum([self._count_blocks(self.quadrants[i]) * i for i in range(0, 4)])
-        else:
-            score = sum([self._count_blocks(self.quadrants[i]) * (3-i) for i in range(0, 4)])  # TODO: consider anchors
-        return self._normalize(score, 0, 27)
-
-    def _bear_in_score(self):
-        """ Maximize the amount of checkers inside home board"""
-        score_x = sum([sum([1 for point in col if point == self.opponent]) for col in self.quadrants[0]])
-        score_o = sum([sum([1 for point in col if point == self.opponent]) for col in self.quadrants[3]])
-        if self.player == 'o':
-            score = sum([sum([1 for point in col if point == self.player]) for col in self.quadrants[3]]) - score_x/2
-        else:
-            score = sum([sum([1 for point in col if point == self.player]) for col in self.quadrants[0]]) - score_o/2
-        return self._normalize(score, 0, 15)
-
-    def _bear_off_score(self):
-        """ Maximize the amount of checkers inside home board"""
-        score = len(self.game.off_pieces[self.player]) - len(self.game.off_pieces[self.opponent])
-        return self._normalize(score, 0, 15)
-
-    def _fill_quadrants(self):
-        grid = self.game.grid
-        self.quadrants = [
-            grid[0:6],
-            grid[6:12],
-            grid[12:18],
-            grid[18:24],
-        ]
-
-    def _count_blocks(self, quarter):
-        return sum([sum([1 for point in col if point == self.player]) for col in quarter if sum([1 for point in col if point == self.player]) > 1])
-
-    def _count_blots(self, quarter):
-        return sum([sum([1 for point in col if point == self.player]) for col in quarter])
-
     @staticmethod
     def _normalize(x: float, x_min: float, x_max: float) -> float:
         """
@@ -117,4 +199,4 @@ class HeuristicEvaluator:
         :param x_min: the minimum possible value of the feature.
         :return: A number between 0 and 1.
         """
-        return (x - x_min) / (x_max - x_min)
\ No newline at end of file
+        return (x - x_min) / (x_max - x_min)
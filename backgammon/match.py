@@ -0,0 +1,27 @@
+from . import profiling
+from .game import Game
+
+
+def play_match(agents, num_games=10, draw=False):
+    """
+    Play num_games games between agents[0] (Game.TOKENS[0]) and agents[1]
+    (Game.TOKENS[1]), print each winner and a summary, return the win counts.
+    With profiling enabled, each game gets its own entry in the profile.
+    """
+    wins = [0, 0]
+
+    for i in range(num_games):
+        game = Game.new()
+        if profiling.active is None:
+            winner = game.play(agents, draw=draw)
+        else:
+            with profiling.active.game():
+                winner = game.play(agents, draw=draw)
+        wins[winner] += 1
+
+        print(f"Game {i + 1}: Winner is {winner}")
+
+    print(f"\nSummary after {num_games} games:")
+    for agent, agent_wins in zip(agents, wins):
+        print(f"{agent.name} Agent wins: {agent_wins}")
+    return wins
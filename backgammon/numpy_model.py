@@ -0,0 +1,62 @@
+import numpy as np
+
+# Variable names of the two Dense layers in a tf.train.Checkpoint written by model.Model
+CHECKPOINT_VARIABLES = [
+    'model/dense1/_kernel/.ATTRIBUTES/VARIABLE_VALUE',
+    'model/dense1/bias/.ATTRIBUTES/VARIABLE_VALUE',
+    'model/dense2/_kernel/.ATTRIBUTES/VARIABLE_VALUE',
+    'model/dense2/bias/.ATTRIBUTES/VARIABLE_VALUE',
+]
+
+
+def sigmoid(x):
+    # tanh form does not overflow for large negative inputs
+    return 0.5 * (1. + np.tanh(0.5 * x))
+
+
+class NumpyModel(object):
+    """
+    Forward pass of the TD-Gammon network (two sigmoid Dense layers) in plain NumPy.
+    Can stand in for model.Model wherever only inference is needed, e.g. in TDAgent,
+    without importing TensorFlow.
+    """
+
+    def __init__(self, weights):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.w1, self.b1, self.w2, self.b2 = self.weights
+
+    def __call__(self, inputs, training=False):
+        x = np.asarray(inputs, dtype=np.float32)
+        hidden = sigmoid(x @ self.w1 + self.b1)
+        return sigmoid(hidden @ self.w2 + self.b2)
+
+    def predict_batch(self, x):
+        return self(x)
+
+    def save(self, path):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return NumpyModel([data['w1'], data['b1'], data['w2'], data['b2']])
+
+    @staticmethod
+    def from_model(model):
+        """
+        Copy the weights of a built model.Model.
+        """
+        return NumpyModel([layer.numpy() for layer in [model.dense1.kernel, model.dense1.bias,
+                                                         model.dense2.kernel, model.dense2.bias]])
+
+    @staticmethod
+    def from_checkpoint(checkpoint_path):
+        """
+        Read the weights from a checkpoint prefix, or the latest checkpoint in a directory.
+        Needs TensorFlow, but only for reading the checkpoint file.
+        """
+        import tensorflow as tf
+
+        latest = tf.train.latest_checkpoint(checkpoint_path)
+        reader = tf.train.load_checkpoint(latest or checkpoint_path)
+        return NumpyModel([reader.get_tensor(name) for name in CHECKPOINT_VARIABLES])
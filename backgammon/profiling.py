@@ -0,0 +1,128 @@
+"""
+Optional counters and timers for the engine and agents.
+
+Instrumented code reads profiling.active, which is None unless a Profile is
+enabled, so with profiling off each instrumented call costs one attribute
+lookup:
+
+    with profiling.enabled() as profile:
+        play_match(agents, 10)
+    profile.save('profile.json')
+
+Counters count events (moves generated, nodes searched, evaluations, cache
+hits) and timers add up seconds spent in a phase. Timers are inclusive:
+get_action includes the evaluations made during it. Besides the totals, a
+Profile keeps the events of each game (see game) and of each agent (see
+agent, set by Game.take_turn while the agent chooses its move).
+"""
+import json
+import time
+from contextlib import contextmanager
+
+active = None
+
+
+class Profile(object):
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.games = []
+        self.agents = {}
+        # profiles that record the events: this one, the current game's and agent's
+        self._targets = [self]
+
+    def count(self, name, n=1):
+        for profile in self._targets:
+            profile.counters[name] = profile.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds, n=1):
+        """
+        Add seconds spent in n calls of name, to its timer and its counter.
+        """
+        for profile in self._targets:
+            profile.timers[name] = profile.timers.get(name, 0.) + seconds
+            profile.counters[name] = profile.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        """
+        add_time the time spent in the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    @contextmanager
+    def game(self):
+        """
+        Record the events of the block in a new entry of games too.
+        """
+        profile = Profile()
+        self.games.append(profile)
+        with self._recording(profile):
+            yield profile
+
+    @contextmanager
+    def agent(self, name):
+        """
+        Record the events of the block under agents[name] too.
+        """
+        profile = self.agents.get(name)
+        if profile is None:
+            profile = self.agents[name] = Profile()
+        with self._recording(profile):
+            yield profile
+
+    @contextmanager
+    def _recording(self, profile):
+        self._targets.append(profile)
+        try:
+            yield
+        finally:
+            self._targets.remove(profile)
+
+    def to_dict(self):
+        profile = {'counters': dict(self.counters), 'timers': dict(self.timers)}
+        if self.games:
+            profile['games'] = [game.to_dict() for game in self.games]
+        if self.agents:
+            profile['agents'] = {name: agent.to_dict() for name, agent in self.agents.items()}
+        return profile
+
+    def save(self, path):
+        """
+        Write to_dict to path as JSON.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def write_summaries(self, step, prefix='profile/'):
+        """
+        The totals and the agents' counters and timers as tf.summary scalars,
+        to the default summary writer.
+        """
+        import tensorflow as tf
+
+        scopes = [('', self)] + [(name + '/', agent) for name, agent in self.agents.items()]
+        for scope, profile in scopes:
+            for name, value in profile.counters.items():
+                tf.summary.scalar(prefix + scope + name, value, step=step)
+            for name, value in profile.timers.items():
+                tf.summary.scalar(prefix + scope + name + '_seconds', value, step=step)
+
+
+@contextmanager
+def enabled(profile=None):
+    """
+    Record into profile (default: a new Profile) for the duration of the block.
+    """
+    global active
+    previous = active
+    active = Profile() if profile is None else profile
+    try:
+        yield active
+    finally:
+        active = previous
@@ -0,0 +1,115 @@
+import queue
+import random
+
+import numpy as np
+
+from .agents.td_gammon_agent import TDAgent
+from .dice import Dice
+from .game import Game
+from .numpy_model import NumpyModel
+
+
+def play_self_play_game(model, dice=None):
+    """
+    Play one game of model against itself, the same way Model.train does
+    (races too are played by the network, not the bear-off database), with
+    dice (a backgammon.dice.Dice, default: from the global random).
+    Returns the features of every position with the side to move (one row per
+    half-move plus the final position) and the winner's index.
+    """
+    players = [TDAgent(Game.TOKENS[0], model, bearoff=False), TDAgent(Game.TOKENS[1], model, bearoff=False)]
+
+    game = Game.new(dice).track_features()
+    player_num = game.dice.first_player()
+
+    features = [game.extract_features(players[player_num].player)]
+    while not game.is_over():
+        game.next_step(players[player_num], player_num)
+        player_num = (player_num + 1) % 2
+        features.append(game.extract_features(players[player_num].player))
+
+    return np.vstack(features).astype(np.float32), game.winner()
+
+
+def td_lambda_targets(values, outcome, lam):
+    """
+    TD(lambda) targets of one game: the lambda-return of every position but
+    the final one. values[t] is the value of position t + 1; the final
+    position's value is replaced by the outcome. With the weights fixed
+    during the game, training on these targets gives the same update as
+    TD(lambda) with accumulating eligibility traces.
+    """
+    next_values = np.array(values, dtype=np.float64).reshape(-1)
+    next_values[-1] = outcome
+    targets = np.empty(len(next_values))
+    target = outcome
+    for t in range(len(next_values) - 1, -1, -1):
+        target = (1. - lam) * next_values[t] + lam * target
+        targets[t] = target
+    return targets
+
+
+class WeightsChannel(object):
+    """
+    Latest-weights-only channel from the learner to the self-play workers: one
+    shared float32 buffer that every publish overwrites, with a version number
+    so workers only copy the weights when they changed. Unlike a queue per
+    worker, broadcasts a worker never reads don't pile up.
+    """
+
+    def __init__(self, ctx, shapes):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.buffer = ctx.Array('f', sum(int(np.prod(shape)) for shape in self.shapes))
+        # only read and written under the buffer's lock
+        self.version = ctx.Value('i', 0, lock=False)
+
+    def publish(self, weights):
+        with self.buffer.get_lock():
+            np.frombuffer(self.buffer.get_obj(), dtype=np.float32)[:] = \
+                np.concatenate([np.ravel(w) for w in weights])
+            self.version.value += 1
+
+    def latest(self, version=None):
+        """
+        (version, weights) of the newest weights, or None if they are still
+        the ones of version.
+        """
+        with self.buffer.get_lock():
+            if self.version.value == version:
+                return None
+            version = self.version.value
+            flat = np.frombuffer(self.buffer.get_obj(), dtype=np.float32).copy()
+        weights = []
+        offset = 0
+        for shape in self.shapes:
+            size = int(np.prod(shape))
+            weights.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return version, weights
+
+
+def self_play_worker(worker_id, weights_channel, results_queue, stop, seed=None):
+    """
+    Worker process loop: keep playing self-play games with the newest weights
+    of weights_channel (a WeightsChannel, published to before the worker
+    starts) and put (worker_id, features, winner) on results_queue until stop
+    is set. With a seed, each worker rolls its own reproducible dice.
+    """
+    dice = Dice(random.Random(seed + worker_id)) if seed is not None else None
+
+    version, weights = weights_channel.latest()
+    model = NumpyModel(weights)
+    while not stop.is_set():
+        # pick up the latest broadcast, if any, before the next game
+        latest = weights_channel.latest(version)
+        if latest is not None:
+            version, weights = latest
+            model = NumpyModel(weights)
+
+        features, winner = play_self_play_game(model, dice)
+        while not stop.is_set():
+            try:
+                results_queue.put((worker_id, features, winner), timeout=0.1)
+                break
+            except queue.Full:
+                pass
@@ -0,0 +1,116 @@
+import math
+import multiprocessing
+import random
+import time
+
+from .agents.factory import make_agent
+from .dice import Dice
+from .game import Game
+from .numpy_model import NumpyModel
+
+# Agents of the current worker process, built once by _init_worker:
+# _agents[i][t] is agent i playing token Game.TOKENS[t].
+_agents = None
+
+
+def _init_worker(specs, weights, cache_size=None):
+    global _agents
+    model = NumpyModel(weights) if weights is not None else None
+    load_model = (lambda: model) if model is not None else None
+    _agents = [[make_agent(spec, token, load_model, cache_size=cache_size) for token in Game.TOKENS]
+               for spec in specs]
+
+
+def _play_game(task):
+    """
+    Play one seeded game. Agent 0 takes Game.TOKENS[seat] and the player with
+    index first starts. The dice have their own stream, apart from the
+    agents' random moves. Returns (index, winning agent, half-moves played).
+    """
+    index, seed, seat, first = task
+    random.seed('%s-%d' % (seed, index))
+
+    # players[t] plays token Game.TOKENS[t]
+    players = [None, None]
+    players[seat] = _agents[0][seat]
+    players[1 - seat] = _agents[1][1 - seat]
+    game = Game.new(Dice(random.Random('%s-%d-dice' % (seed, index))))
+    player_num = first
+    turns = 0
+    while not game.is_over():
+        game.next_step(players[player_num], player_num)
+        player_num = (player_num + 1) % 2
+        turns += 1
+
+    winner = game.winner()
+    return index, 0 if winner == seat else 1, turns
+
+
+def wilson_interval(wins, n, z=1.96):
+    """
+    Wilson score confidence interval for a win rate of wins out of n games.
+    """
+    if n == 0:
+        return 0., 1.
+    p = wins / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return centre - half_width, centre + half_width
+
+
+def run_tournament(specs, num_games, num_workers=None, seed=0, model_path=None, cache_size=None):
+    """
+    Play num_games games between the two agent specs over a process pool.
+    Seats and the first player rotate every game so both agents play each
+    token and move first equally often, and every game has its own seed, so
+    results don't depend on how games are scheduled. model_path is the .npz
+    file td agents load their NumpyModel from. With cache_size, the agents of
+    each worker keep an EvaluationCache over all the games they play.
+    The model is loaded here, before the pool starts, so a missing file
+    raises at once instead of failing in every worker the pool respawns.
+    """
+    weights = None
+    if any(spec.partition(':')[0] == 'td' for spec in specs):
+        if not model_path:
+            raise ValueError('td agents need a model_path to load their weights from')
+        weights = NumpyModel.load(model_path).weights
+    tasks = [(i, seed, i % 2, (i // 2) % 2) for i in range(num_games)]
+    wins = [0, 0]
+    seat_wins = [0, 0]
+    seat_games = [0, 0]
+    total_turns = 0
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(specs, weights, cache_size)) as pool:
+        for index, winner, turns in pool.imap_unordered(_play_game, tasks, chunksize=4):
+            seat = tasks[index][2]
+            wins[winner] += 1
+            seat_games[seat] += 1
+            seat_wins[seat] += winner == 0
+            total_turns += turns
+    elapsed = time.perf_counter() - start
+
+    return {
+        'agents': list(specs),
+        'games': num_games,
+        'wins': wins,
+        'win_rate': [w / num_games for w in wins],
+        'confidence_interval': [wilson_interval(w, num_games) for w in wins],
+        # agent 0's win rate when playing Game.TOKENS[0] and Game.TOKENS[1]
+        'seat_win_rate': [w / n if n else 0. for w, n in zip(seat_wins, seat_games)],
+        'games_per_second': num_games / elapsed,
+        'average_game_length': total_turns / num_games,
+        'seconds': elapsed,
+    }
+
+
+def print_report(stats):
+    print(f"\nSummary after {stats['games']} games:")
+    for spec, wins, rate, (low, high) in zip(stats['agents'], stats['wins'], stats['win_rate'],
+                                             stats['confidence_interval']):
+        print(f"{spec} Agent wins: {wins} ({rate:.1%}, 95% CI {low:.1%} - {high:.1%})")
+    print(f"{stats['agents'][0]} win rate as {Game.TOKENS[0]}: {stats['seat_win_rate'][0]:.1%}, "
+          f"as {Game.TOKENS[1]}: {stats['seat_win_rate'][1]:.1%}")
+    print(f"{stats['games_per_second']:.2f} games/s, average game length "
+          f"{stats['average_game_length']:.1f} half-moves ({stats['seconds']:.1f}s)")
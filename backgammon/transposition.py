@@ -0,0 +1,54 @@
+EXACT = 0
+LOWER = 1  # the true value is at least the stored one
+UPPER = 2  # the true value is at most the stored one
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results indexed by Zobrist hash (see Game.zobrist_hash).
+    Each slot holds one entry (key, value, depth, node type, generation). A new entry
+    replaces the old one if the slot is empty, the old entry is from an earlier search
+    (generation) or it was searched no deeper than the new one.
+    """
+
+    def __init__(self, size_bits=16):
+        self.size = 1 << size_bits
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_search(self):
+        """
+        Age the current entries: they stay usable, but the next search may overwrite them.
+        """
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, depth):
+        """
+        Return the entry for key if it was searched at least depth deep, otherwise None.
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key and entry[2] >= depth:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, value, depth, node_type=EXACT):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[4] != self.generation or entry[2] <= depth:
+            self.entries[index] = (key, value, depth, node_type, self.generation)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
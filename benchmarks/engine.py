@@ -0,0 +1,276 @@
+"""
+Benchmarks of the engine and agents on a fixed corpus.
+
+The corpus is a list of positions, each with the player to move and a roll,
+taken from games of seeded random play, so every run times the same work.
+Each case times its operations one by one and reports operations per second
+and the p50/p99 latency of one operation. The game cases play whole seeded
+games between two agents.
+
+Results can be saved as a baseline and later runs compared against it; the
+comparison fails (exit status 1) when a case runs slower than the baseline
+by more than the tolerance. Baselines only compare on the same machine, so
+none is committed: benchmarks/baseline.json is ignored by git and written
+locally with --save.
+
+Run from the repository root:
+    python benchmarks/engine.py --save                # write a baseline on this machine
+    python benchmarks/engine.py                       # compare with benchmarks/baseline.json
+    python benchmarks/engine.py --cases evaluate game # only the cases matching these words
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set iteration order (and so the moves agents pick) depends on string hashing
+if os.environ.get('PYTHONHASHSEED') != '0':
+    os.environ['PYTHONHASHSEED'] = '0'
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+sys.path.insert(0, ROOT)
+
+from backgammon.agents.expecti_mm_agent import ExpectMinMaxAgent  # noqa: E402
+from backgammon.agents.factory import make_agent  # noqa: E402
+from backgammon.agents.td_gammon_agent import TDAgent  # noqa: E402
+from backgammon.game import Game  # noqa: E402
+from backgammon.heuristics import HeuristicEvaluator  # noqa: E402
+from backgammon.numpy_model import NumpyModel  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+MODEL_PATH = os.path.join(ROOT, 'checkpoints', 'final_1500.npz')
+
+
+def make_corpus(size, seed):
+    """
+    size (board, off, player, roll) tuples from games of seeded random play.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < size:
+        game = Game.new()
+        player_num = rng.randint(0, 1)
+        while not game.is_over() and len(corpus) < size:
+            player = Game.TOKENS[player_num]
+            roll = (rng.randint(1, 6), rng.randint(1, 6))
+            corpus.append((bytes(game.board), dict(game.off), player, roll))
+            moves = sorted(game.generate_actions(roll, player), key=str)
+            if moves:
+                game.take_action(rng.choice(moves), player)
+            player_num = 1 - player_num
+    return corpus
+
+
+def corpus_digest(corpus):
+    return hashlib.md5(repr(corpus).encode()).hexdigest()[:12]
+
+
+def position(entry):
+    board, off, player, roll = entry
+    return Game(None, board, off, {t: 15 for t in Game.TOKENS}, Game.TOKENS), player, roll
+
+
+def first_move(game, player, roll):
+    moves = game.generate_actions(roll, player)
+    return min(moves, key=str) if moves else None
+
+
+# Each case takes the corpus and returns the operations to time, as callables
+
+def get_actions_case(corpus):
+    Game.move_cache.clear()
+    ops = []
+    for entry in corpus:
+        game, player, roll = position(entry)
+        ops.append(lambda game=game, player=player, roll=roll: game.get_actions(roll, player))
+    return ops
+
+
+def take_undo_case(corpus):
+    def take_undo(game, move, player):
+        ateList = game.take_action(move, player)
+        game.undo_action(move, player, ateList)
+
+    ops = []
+    for entry in corpus:
+        game, player, roll = position(entry)
+        move = first_move(game, player, roll)
+        if move:
+            ops.append(lambda game=game, move=move, player=player: take_undo(game, move, player))
+    return ops
+
+
+def extract_features_case(corpus):
+    ops = []
+    for entry in corpus:
+        game, player, _ = position(entry)
+        ops.append(lambda game=game, player=player: game.extract_features(player))
+    return ops
+
+
+def evaluate_case(corpus):
+    evaluator = HeuristicEvaluator(Game.new(), 0)
+    ops = []
+    for entry in corpus:
+        game, player, _ = position(entry)
+        ops.append(lambda game=game, player=player: evaluator.evaluate(game, player))
+    return ops
+
+
+def agent_case(make, size):
+    """
+    Case timing make(player).get_action on the first size positions.
+    """
+    def case(corpus):
+        agents = {t: make(t) for t in Game.TOKENS}
+        ops = []
+        for entry in corpus[:size]:
+            game, player, roll = position(entry)
+            moves = game.get_actions(roll, player)
+            if moves:
+                ops.append(lambda game=game, moves=moves, agent=agents[player]: agent.get_action(moves, game))
+        return ops
+    return case
+
+
+def expectiminimax(depth):
+    def make(player):
+        return ExpectMinMaxAgent(depth, player, HeuristicEvaluator(Game.new(), Game.TOKENS.index(player)))
+    return make
+
+
+def game_case(specs, num_games, seed):
+    """
+    Case timing num_games whole games between the agents of specs, game i
+    seeded with seed + i.
+    """
+    def play(agents, game_seed):
+        random.seed(game_seed)
+        Game.new().play(agents)
+
+    def case(corpus):
+        Game.move_cache.clear()
+        agents = [make_agent(spec, token, lambda: NumpyModel.load(MODEL_PATH))
+                  for spec, token in zip(specs, Game.TOKENS)]
+        return [lambda i=i: play(agents, seed + i) for i in range(num_games)]
+    return case
+
+
+def cases(seed):
+    """
+    (name, case, whether it needs the TD network) of every case.
+    """
+    td = lambda player: TDAgent(player, NumpyModel.load(MODEL_PATH))  # noqa: E731
+    return [
+        ('Game.get_actions', get_actions_case, False),
+        ('take_action/undo_action', take_undo_case, False),
+        ('extract_features', extract_features_case, False),
+        ('HeuristicEvaluator.evaluate', evaluate_case, False),
+        ('TDAgent.get_action', agent_case(td, 500), True),
+        ('ExpectMinMaxAgent.get_action depth 1', agent_case(expectiminimax(1), 200), False),
+        ('ExpectMinMaxAgent.get_action depth 2', agent_case(expectiminimax(2), 100), False),
+        ('game random vs random', game_case(('random', 'random'), 100, seed), False),
+        ('game eater vs close', game_case(('eater', 'close'), 100, seed), False),
+        ('game td vs random', game_case(('td', 'random'), 50, seed), True),
+        ('game expectiminimax vs td', game_case(('expectiminimax', 'td'), 20, seed), True),
+        ('game expectiminimax:2 vs random', game_case(('expectiminimax:2', 'random'), 3, seed), False),
+    ]
+
+
+def run(ops):
+    """
+    Time each operation. Returns ops/sec and the p50/p99 latency in seconds.
+    """
+    times = np.empty(len(ops))
+    for i, op in enumerate(ops):
+        start = time.perf_counter()
+        op()
+        times[i] = time.perf_counter() - start
+    return {
+        'ops': len(ops),
+        'ops_per_sec': len(ops) / times.sum(),
+        'p50': float(np.percentile(times, 50)),
+        'p99': float(np.percentile(times, 99)),
+    }
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return '%.1fus' % (seconds * 1e6)
+    if seconds < 1:
+        return '%.2fms' % (seconds * 1e3)
+    return '%.2fs' % seconds
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each case's speed relative to the baseline. Returns the names of
+    the cases slower than the baseline by more than tolerance.
+    """
+    if baseline['corpus'] != results['corpus']:
+        print('Warning: the baseline was measured on a different corpus %s' % baseline['corpus'])
+    slower = []
+    print('\n%-40s %10s' % ('vs baseline', 'speed'))
+    for name, result in results['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            print('%-40s %10s' % (name, 'new'))
+            continue
+        ratio = result['ops_per_sec'] / before['ops_per_sec']
+        flag = ''
+        if ratio < 1 - tolerance:
+            slower.append(name)
+            flag = '  REGRESSION'
+        print('%-40s %9.2fx%s' % (name, ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the corpus and of the games.')
+    parser.add_argument('--size', type=int, default=2000, help='Positions in the corpus.')
+    parser.add_argument('--cases', nargs='*', default=None,
+                        help='Only run the cases whose name contains one of these words.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file.')
+    parser.add_argument('--save', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction of the baseline speed a case may lose before it fails.')
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.size, args.seed)
+    results = {'corpus': {'seed': args.seed, 'size': args.size, 'digest': corpus_digest(corpus)}, 'cases': {}}
+    print('corpus: %d positions, seed %d, digest %s' % (args.size, args.seed, results['corpus']['digest']))
+    print('\n%-40s %8s %12s %10s %10s' % ('case', 'ops', 'ops/sec', 'p50', 'p99'))
+    for name, case, needs_model in cases(args.seed):
+        if args.cases and not any(word.lower() in name.lower() for word in args.cases):
+            continue
+        if needs_model and not os.path.exists(MODEL_PATH):
+            print('%-40s skipped, %s is missing' % (name, MODEL_PATH))
+            continue
+        result = results['cases'][name] = run(case(corpus))
+        print('%-40s %8d %12.1f %10s %10s' % (name, result['ops'], result['ops_per_sec'],
+                                              format_time(result['p50']), format_time(result['p99'])))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('\nSaved the baseline to %s' % args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        if slower:
+            print('\n%d case(s) slower than the baseline: %s' % (len(slower), ', '.join(slower)))
+            sys.exit(1)
+    else:
+        print('\nNo baseline at %s to compare with; record one on this machine with --save' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Startup-time benchmark for short evaluation processes.
+
+Times fresh interpreters importing the engine and agents, and running a one
+game play-only match through main.py, and checks that none of the play-only
+paths pull in TensorFlow.
+
+Run from the repository root: python benchmarks/startup.py [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# TD agents read the exported weights of a shipped checkpoint
+os.environ.setdefault('CHECKPOINT_PATH', os.path.join('checkpoints', 'final_1500'))
+
+CHECK_NO_TF = "import sys; assert 'tensorflow' not in sys.modules, 'tensorflow was imported'"
+
+
+def play_case(*argv):
+    """ Run main.py in-process so the TensorFlow check sees its imports. """
+    return ['-c', 'import runpy, sys; sys.argv = %r; runpy.run_path("main.py", run_name="__main__"); %s'
+            % (['main.py', '--play', '--games', '1'] + list(argv), CHECK_NO_TF)]
+
+
+CASES = [
+    ('import engine and agents',
+     ['-c', 'import backgammon.game, backgammon.agents.factory, backgammon.match; ' + CHECK_NO_TF]),
+    ('play random vs eater', play_case('--agents', 'random', 'eater')),
+    ('play expectiminimax vs random', play_case('--agents', 'expectiminimax', 'random')),
+    ('play td (numpy) vs random', play_case('--agents', 'td', 'random', '--numpy')),
+]
+
+
+def time_command(argv, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the median is reported.')
+    args = parser.parse_args()
+
+    for name, argv in CASES:
+        times = time_command(argv, args.repeat)
+        print(f"{name:<32} median {statistics.median(times):.3f}s  min {min(times):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,49 @@
 import os
 import argparse
-import tensorflow as tf
-from tensorflow.keras.callbacks import ModelCheckpoint
-from model import Model
+import functools
+
+# TensorFlow is imported lazily (see load_model), so play-only runs between
+# agents that don't use the network start without it.
+from backgammon import profiling
+from backgammon.eval_cache import EvaluationCache
+from backgammon.game import Game
+from backgammon.numpy_model import NumpyModel
+from backgammon.agents.factory import AGENT_NAMES, make_agent
+from backgammon.match import play_match
+from backgammon.tournament import print_report, run_tournament
 
 # Set up argument parsing with argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('--test', action='store_true', help='If true, test against a random strategy.')
 parser.add_argument('--play', action='store_true', help='If true, play against a trained TD-Gammon strategy.')
 parser.add_argument('--restore', action='store_true', help='If true, restore a checkpoint before training.')
+parser.add_argument('--export', action='store_true', help='If true, export the checkpoint weights to a NumPy .npz file.')
+parser.add_argument('--agents', nargs=2, default=['expectiminimax', 'td'],
+                    help='The two agents to play with --play, one of %s, optionally with a search depth '
+                         '(e.g. expectiminimax:2) and for expectiminimax a time limit per move in seconds '
+                         '(e.g. expectiminimax:4:0.5).' % ', '.join(AGENT_NAMES))
+parser.add_argument('--games', type=int, default=100, help='Number of games to play with --play.')
+parser.add_argument('--workers', type=int, default=0,
+                    help='If set, train with this many self-play worker processes feeding one learner, '
+                         'or with --play, run the games as a tournament over this many processes.')
+parser.add_argument('--search-workers', type=int, default=0,
+                    help='If set, expectiminimax agents search the moves of a turn, and rollout agents run '
+                         'their trials, over this many processes.')
+parser.add_argument('--eval-cache', type=int, default=0,
+                    help='If set, td and expectiminimax agents cache the values of up to this many positions.')
+parser.add_argument('--td-lambda', type=float, default=None,
+                    help='If set, train with TD(lambda) targets and batched updates, with this lambda.')
+parser.add_argument('--profile', default=None,
+                    help='If set, write counters and timers of the engine and agents to this JSON file '
+                         '(with --play in one process, or training without --workers or --td-lambda).')
+parser.add_argument('--seed', type=int, default=0, help='Base seed for the games of a --play tournament.')
+parser.add_argument('--numpy', action='store_true',
+                    help='If true, TD agents use the exported .npz weights instead of TensorFlow.')
 args = parser.parse_args()
 
 model_path = os.environ.get('MODEL_PATH', 'models/')
 summary_path = os.environ.get('SUMMARY_PATH', 'summaries/')
-checkpoint_path = 'checkpoints/final_2000'
+checkpoint_path = os.environ.get('CHECKPOINT_PATH', 'checkpoints/final_2000')
 
 # Create directories if they do not exist
 os.makedirs(model_path, exist_ok=True)
@@ -21,20 +51,63 @@ os.makedirs(summary_path, exist_ok=True)
 # Ensure checkpoint path directory creation
 os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
 
-if __name__ == '__main__':
-    # Create a TensorFlow 2.x Model instance
-    model = Model(model_path, summary_path, checkpoint_path, restore=args.restore)
 
-    # Define ModelCheckpoint callback
-    checkpoint_callback = ModelCheckpoint(
-        filepath=os.path.join(checkpoint_path + '_checkpoint.weights.h5'),
-        save_weights_only=True,  # Set to True if you only want to save weights
-        save_best_only=True,  # Save only the best model
-        verbose=1
-    )
+@functools.lru_cache(maxsize=None)
+def load_model():
+    """
+    Load the network once, only when a TD agent or training asks for it.
+    """
+    if args.numpy:
+        return NumpyModel.load(checkpoint_path + '.npz')
+    from model import Model
+    return Model(model_path, summary_path, checkpoint_path, restore=args.restore)
+
+
+if __name__ == '__main__':
+    if args.export:
+        # Weights for NumpyModel, which plays without TensorFlow
+        NumpyModel.from_checkpoint(checkpoint_path).save(checkpoint_path + '.npz')
+        raise SystemExit
 
     # Perform actions based on command-line arguments
-    if args.play:
-        model.play(100)
+    if args.play and args.workers:
+        # Workers run td agents from the exported weights
+        stats = run_tournament(args.agents, args.games, args.workers, seed=args.seed,
+                               model_path=checkpoint_path + '.npz', cache_size=args.eval_cache or None)
+        print_report(stats)
+    elif args.play:
+        agents = [make_agent(spec, token, load_model, args.search_workers or None, args.eval_cache or None)
+                  for spec, token in zip(args.agents, Game.TOKENS)]
+        if args.profile:
+            with profiling.enabled() as profile:
+                play_match(agents, args.games, draw='human' in args.agents)
+            profile.save(args.profile)
+        else:
+            play_match(agents, args.games, draw='human' in args.agents)
+        for agent in agents:
+            evaluator = getattr(agent, 'heuristic', getattr(agent, 'model', None))
+            if isinstance(evaluator, EvaluationCache):
+                print('%s evaluation cache hit rate: %.1f%%' % (agent.name, 100 * evaluator.hit_rate))
+            if hasattr(agent, 'close'):
+                agent.close()
     else:
-        model.train()
+        from tensorflow.keras.callbacks import ModelCheckpoint
+        from model import Model
+
+        # Create a TensorFlow 2.x Model instance
+        model = Model(model_path, summary_path, checkpoint_path, restore=args.restore)
+
+        # Define ModelCheckpoint callback
+        checkpoint_callback = ModelCheckpoint(
+            filepath=os.path.join(checkpoint_path + '_checkpoint.weights.h5'),
+            save_weights_only=True,  # Set to True if you only want to save weights
+            save_best_only=True,  # Save only the best model
+            verbose=1
+        )
+
+        if args.workers:
+            model.train_parallel(num_workers=args.workers)
+        elif args.td_lambda is not None:
+            model.train_lambda(lam=args.td_lambda)
+        else:
+            model.train(profile_path=args.profile)
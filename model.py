@@ -1,7 +1,13 @@
 import os
+import contextlib
+import multiprocessing
+import queue
+import numpy as np
 import tensorflow as tf
 
 from backgammon.agents.human_agent import HumanAgent
+from backgammon.batch import BatchGame, TDPolicy
+from backgammon.dice import Dice
 from backgammon.agents.random_agent import RandomAgent
 from backgammon.game import Game
 from backgammon.agents.td_gammon_agent import TDAgent
@@ -10,6 +16,10 @@ from backgammon.agents.eater_agent import EaterAgent
 from backgammon.agents.close_agent import CloseAgent
 from backgammon.agents.expecti_mm_agent import ExpectMinMaxAgent
 from backgammon.heuristics import HeuristicEvaluator
+from backgammon.match import play_match
+from backgammon.numpy_model import NumpyModel
+from backgammon import profiling
+from backgammon.selfplay import WeightsChannel, self_play_worker, td_lambda_targets
 
 
 class Model(tf.keras.Model):
@@ -52,7 +62,15 @@ class Model(tf.keras.Model):
         x = self.dense1(inputs)
         return self.dense2(x)
 
-    @tf.function
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, Game.NUM_FEATURES], dtype=tf.float32)])
+    def predict_batch(self, x):
+        """
+        Score a batch of feature rows with one compiled forward pass.
+        """
+        return self(x, training=False)
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, Game.NUM_FEATURES], dtype=tf.float32),
+                                  tf.TensorSpec(shape=[None, 1], dtype=tf.float32)])
     def train_step(self, x, V_next):
         with tf.GradientTape() as tape:
             V = self(x, training=True)
@@ -68,33 +86,47 @@ class Model(tf.keras.Model):
         self.delta_metric.update_state(delta)
         self.accuracy_metric.update_state(accuracy)
 
-    def train(self):
+    def train(self, profile_path=None, seed=None):
+        """
+        Self-play training, one train_step per move. With a seed, the games
+        roll their dice from their own random.Random. With profile_path, the
+        counters and timers of each game (see backgammon.profiling) are written
+        as summaries next to the metrics, and all of them to profile_path as JSON.
+        """
         summary_writer = tf.summary.create_file_writer(self.summary_path)
+        profile = profiling.Profile() if profile_path else None
+        dice = Dice(random.Random(seed)) if seed is not None else Dice()
 
         # The agent plays against itself
-        players = [TDAgent(Game.TOKENS[0], self), TDAgent(Game.TOKENS[1], self)]
+        # races are played by the network too, so it learns them (and plays like TDPolicy in train_lambda)
+        players = [TDAgent(Game.TOKENS[0], self, bearoff=False), TDAgent(Game.TOKENS[1], self, bearoff=False)]
 
         episodes = 100
 
         for episode in range(episodes):
 
-            game = Game.new()
-            player_num = random.randint(0, 1)
+            with self._profiling(profile) as game_profile:
+                timer = profile.timer if profile is not None else lambda name: contextlib.nullcontext()
+
+                game = Game.new(dice).track_features()
+                player_num = dice.first_player()
 
-            x = game.extract_features(players[player_num].player)
+                x = game.extract_features(players[player_num].player)
 
-            game_step = 0
-            while not game.is_over():
-                game.next_step(players[player_num], player_num)
-                player_num = (player_num + 1) % 2
+                game_step = 0
+                while not game.is_over():
+                    game.next_step(players[player_num], player_num)
+                    player_num = (player_num + 1) % 2
 
-                x_next = game.extract_features(players[player_num].player)
+                    x_next = game.extract_features(players[player_num].player)
 
-                V_next = self(x_next, training=False)
-                self.train_step(x, V_next)
+                    with timer('model'):
+                        V_next = self(x_next, training=False)
+                    with timer('train_step'):
+                        self.train_step(x, V_next)
 
-                x = x_next
-                game_step += 1
+                    x = x_next
+                    game_step += 1
 
             winner = game.winner()
 
@@ -102,6 +134,8 @@ class Model(tf.keras.Model):
                 tf.summary.scalar('loss', self.loss_metric.result(), step=episode)
                 tf.summary.scalar('delta', self.delta_metric.result(), step=episode)
                 tf.summary.scalar('accuracy', self.accuracy_metric.result(), step=episode)
+                if game_profile is not None:
+                    game_profile.write_summaries(episode)
 
             print(f"Game {episode}/{episodes} (Winner: {players[winner].player}) in {game_step} turns")
 
@@ -109,32 +143,147 @@ class Model(tf.keras.Model):
             self.checkpoint_manager.save()
 
         summary_writer.close()
+        if profile is not None:
+            profile.save(profile_path)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _profiling(profile):
+        """
+        Record the block as a game of profile, if there is one. Yields the
+        game's Profile, or None.
+        """
+        if profile is None:
+            yield None
+            return
+        with profiling.enabled(profile), profile.game() as game_profile:
+            yield game_profile
+
+    def train_parallel(self, num_workers=None, episodes=100, sync_every=10, seed=None):
+        """
+        Self-play training with num_workers worker processes generating games
+        from a NumPy snapshot of the weights, while this process replays them
+        through train_step. New weights go out to the workers every sync_every games.
+        """
+        summary_writer = tf.summary.create_file_writer(self.summary_path)
+        num_workers = num_workers or multiprocessing.cpu_count()
+
+        # Make sure the layers exist before the first snapshot
+        self(tf.zeros((1, Game.NUM_FEATURES)))
+
+        # spawn, so workers don't inherit TensorFlow's state
+        ctx = multiprocessing.get_context('spawn')
+        results_queue = ctx.Queue(maxsize=2 * num_workers)
+        weights_channel = WeightsChannel(ctx, [w.shape for w in NumpyModel.from_model(self).weights])
+        stop = ctx.Event()
+        workers = [ctx.Process(target=self_play_worker, args=(i, weights_channel, results_queue, stop, seed),
+                               daemon=True)
+                   for i in range(num_workers)]
+
+        def broadcast():
+            weights_channel.publish(NumpyModel.from_model(self).weights)
+
+        broadcast()
+        for worker in workers:
+            worker.start()
+
+        try:
+            for episode in range(episodes):
+                worker_id, features, winner = self._next_self_play_game(results_queue, workers)
+
+                # Targets for the whole game in one pass, with the weights as of its
+                # first step. The last transition learns the outcome, 1 if TOKENS[1] won.
+                V_next = self.predict_batch(features[1:]).numpy()
+                V_next[-1] = float(winner)
+                for t in range(len(features) - 1):
+                    self.train_step(features[t:t + 1], V_next[t:t + 1])
+
+                with summary_writer.as_default():
+                    tf.summary.scalar('loss', self.loss_metric.result(), step=episode)
+                    tf.summary.scalar('delta', self.delta_metric.result(), step=episode)
+                    tf.summary.scalar('accuracy', self.accuracy_metric.result(), step=episode)
+
+                print(f"Game {episode}/{episodes} (Winner: {Game.TOKENS[winner]}) in {len(features) - 1} turns"
+                      f" from worker {worker_id}")
+
+                self.checkpoint_manager.save()
+
+                if (episode + 1) % sync_every == 0:
+                    broadcast()
+        finally:
+            stop.set()
+            # unblock workers waiting to hand in a game
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    results_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for worker in workers:
+                worker.join()
+            summary_writer.close()
+
+    def train_lambda(self, episodes=100, lam=0.7, games_per_update=16, batch_size=128, seed=None):
+        """
+        Self-play TD(lambda) training. games_per_update games at a time are
+        played with fixed weights (BatchGame, scoring all games' moves in one
+        NumPy forward pass), their lambda-return targets are computed at the
+        end (td_lambda_targets) and the positions of all of them are replayed
+        through train_step in shuffled mini-batches of batch_size.
+        """
+        summary_writer = tf.summary.create_file_writer(self.summary_path)
+        rng = np.random.default_rng(seed)
+
+        # Make sure the layers exist before the first snapshot
+        self(tf.zeros((1, Game.NUM_FEATURES)))
+
+        episode = 0
+        while episode < episodes:
+            num_games = min(games_per_update, episodes - episode)
+            snapshot = NumpyModel.from_model(self)
+            winners, games = BatchGame(num_games, rng).play([TDPolicy(snapshot)] * 2, record=True)
+
+            # values of every position after the first, of all games in one pass
+            values = snapshot.predict_batch(np.concatenate([features[1:] for features in games])).reshape(-1)
+            ends = np.cumsum([len(features) - 1 for features in games])[:-1]
+            x = np.concatenate([features[:-1] for features in games])
+            targets = np.concatenate([td_lambda_targets(v, float(winner), lam)
+                                      for v, winner in zip(np.split(values, ends), winners)])
+            targets = targets.astype(np.float32).reshape(-1, 1)
+
+            order = rng.permutation(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                self.train_step(x[batch], targets[batch])
+
+            episode += num_games
+            with summary_writer.as_default():
+                tf.summary.scalar('loss', self.loss_metric.result(), step=episode)
+                tf.summary.scalar('delta', self.delta_metric.result(), step=episode)
+                tf.summary.scalar('accuracy', self.accuracy_metric.result(), step=episode)
 
-    def play(self, num_games=10):
-        agent1_wins = 0
-        agent2_wins = 0
-
-        game = Game.new()
-
-        agent_1 = ExpectMinMaxAgent(1, Game.TOKENS[0], HeuristicEvaluator(game, 0))
-        agent_2 = TDAgent(Game.TOKENS[1], self)
+            print(f"Games {episode}/{episodes}: {len(x)} positions, "
+                  f"{Game.TOKENS[0]} won {num_games - int(winners.sum())}, {Game.TOKENS[1]} won {int(winners.sum())}")
 
-        for i in range(num_games):
+            self.checkpoint_manager.save()
 
-            winner = game.play([agent_1, agent_2], draw=False)
+        summary_writer.close()
 
-            if winner == 0:
-                agent1_wins += 1
-            elif winner == 1:
-                agent2_wins += 1
+    @staticmethod
+    def _next_self_play_game(results_queue, workers):
+        while True:
+            try:
+                return results_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError('All self-play workers exited')
 
-            print(f"Game {i + 1}: Winner is {winner}")
+    def play(self, num_games=10):
+        game = Game.new()
 
-            game = Game.new()
+        agent_1 = ExpectMinMaxAgent(1, Game.TOKENS[0], HeuristicEvaluator(game, 0))
+        agent_2 = TDAgent(Game.TOKENS[1], self)
 
-        print(f"\nSummary after {num_games} games:")
-        print(f"{agent_1.name} Agent wins: {agent1_wins}")
-        print(f"{agent_2.name} Agent wins: {agent2_wins}")
+        play_match([agent_1, agent_2], num_games)
 
     def restore(self):
         # Restore the latest checkpoint
@@ -0,0 +1,29 @@
+from backgammon import bearoff
+from backgammon.game import Game
+
+
+def last_checker(player, distance):
+    """
+    player's last checker distance points from the edge, the other 14 off,
+    and the opponent's checkers all on their own side of the board.
+    """
+    opponent = Game.TOKENS[1 - Game.TOKENS.index(player)]
+    board = [0] * Game.NUMSLOTS
+    board[distance - 1 if player == 'x' else Game.NUMCOLS - distance] = Game.SIGN[player]
+    board[Game.NUMCOLS - 1 if player == 'x' else 0] = 15 * Game.SIGN[opponent]
+    return Game(None, board, {player: 14, opponent: 0}, {t: 15 for t in Game.TOKENS},
+                Game.TOKENS)
+
+
+def test_last_checker_plays_both_dice_when_the_big_one_bears_it_off():
+    for player in Game.TOKENS:
+        for roll in [(2, 1), (5, 1)]:
+            game = last_checker(player, 2)
+            moves = game.generate_actions(roll, player)
+            assert len(moves) == 1
+            move = next(iter(moves))
+            assert len(move) == 2 and move[-1][1] == Game.OFF
+
+            game.take_action(move, player)
+            assert game.is_over()
+            assert game.bearoff_position(player) in bearoff.roll_moves((0, 1, 0, 0, 0, 0), roll)